@@ -0,0 +1,30 @@
+'''
+wusu - wrap and unify sys utils
+
+collector() returns the load or storage collector of the running system,
+or of the one asked for:
+    wusu.collector('load').parse_memory()
+    wusu.collector('storage', 'FreeBSD', path='/usr')
+Only the module asked for is imported.
+'''
+import os
+
+SYSTEMS = ('Linux', 'FreeBSD', 'SunOS')
+MODULES = ('load', 'storage')
+
+def sysname():
+    '''Name of the running system, as returned by uname(1).'''
+    return os.uname()[0]
+
+def collector(module, system=None, *args, **kwargs):
+    '''
+    Return an instance of module.system built with args and kwargs,
+    module being 'load' or 'storage' and system one of SYSTEMS,
+    the running system by default.
+    '''
+    system = system or sysname()
+    if module not in MODULES:
+        raise ValueError('unknown module: %s' % module)
+    if system not in SYSTEMS:
+        raise ValueError('unsupported system: %s' % system)
+    return getattr(__import__(module, globals()), system)(*args, **kwargs)
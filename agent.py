@@ -0,0 +1,296 @@
+'''
+Local agent sharing one set of collectors between processes.
+
+The agent collects through load.* and storage.* collectors wrapped in
+cache.Cached and answers over a Unix domain socket, so tools asking for
+the same metrics within its ttl share one df, iostat or netstat run
+instead of forking their own:
+
+    python agent.py [socket]
+
+The socket is in $XDG_RUNTIME_DIR, or /run/wusu, see default_socket().
+Clients have the methods of the collectors they stand for:
+
+    a = agent.Client('load')
+    a.parse_memory()
+    agent.Client('storage').parse_iostat(typed=True, include=('sd*',))
+
+Requests and replies are marshal(3) dumps, each framed by its length as
+a 4 byte unsigned integer in network byte order:
+request: (module, method, args, kwargs)
+reply: (True, result) or (False, error)
+marshal does not know records (typed=True): they are sent as tuples
+(RECORD, class name, fields, values) and built again by the client.
+'''
+import SocketServer
+import threading
+import marshal
+import socket
+import struct
+import errno
+import time
+import sys
+import os
+import cache
+import load
+import storage
+import records
+
+def default_socket():
+    '''
+    Socket path in $XDG_RUNTIME_DIR, private to its user, or in
+    /run/wusu when it is not set (system wide agent run by root).
+    '''
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return os.path.join(runtime, 'wusu.sock')
+    return '/run/wusu/wusu.sock'
+
+SOCKET = default_socket()
+# First member of the tuples records are sent as.
+RECORD = '\0record'
+# Largest frame accepted, in bytes.
+LIMIT = 64 * 1024 * 1024
+
+_length = struct.Struct('!I')
+
+class AgentError(Exception):
+    '''The agent's collector raised, args hold its 'Class: message'.'''
+
+def encode(parsed):
+    '''parsed, a parser result, with records replaced by tuples marshal can dump.'''
+    if isinstance(parsed, records.Record):
+        return (RECORD, parsed.__class__.__name__, tuple(parsed.keys()),
+            tuple([encode(v) for v in parsed.values()]))
+    if isinstance(parsed, dict):
+        return dict([(k, encode(v)) for k, v in parsed.items()])
+    if isinstance(parsed, (list, tuple)):
+        return type(parsed)([encode(v) for v in parsed])
+    return parsed
+
+def decode(sent):
+    '''Parser result encode() returned, with its records built again.'''
+    if isinstance(sent, tuple) and len(sent) == 4 and sent[0] == RECORD:
+        return records.record(sent[2], sent[1])(*[decode(v) for v in sent[3]])
+    if isinstance(sent, dict):
+        return dict([(k, decode(v)) for k, v in sent.items()])
+    if isinstance(sent, (list, tuple)):
+        return type(sent)([decode(v) for v in sent])
+    return sent
+
+def _hashable(value):
+    '''value with its lists turned into tuples.'''
+    if isinstance(value, (list, tuple)):
+        return tuple([_hashable(v) for v in value])
+    return value
+
+def check_owner(path):
+    '''
+    Raise OSError if path is owned by another user than this one or
+    root: a socket another user put there is neither used nor removed.
+    '''
+    try:
+        st = os.lstat(path)
+    except OSError, e:
+        if e.errno == errno.ENOENT:
+            return
+        raise
+    if st.st_uid not in (os.getuid(), 0):
+        raise OSError(errno.EPERM, '%s is owned by uid %d' % (path, st.st_uid))
+
+def send(sock, payload):
+    data = marshal.dumps(payload)
+    sock.sendall(_length.pack(len(data)) + data)
+
+def receive(sock):
+    '''Next frame on sock, None when the peer closed the connection.'''
+    header = _exactly(sock, _length.size)
+    if header is None:
+        return None
+    size = _length.unpack(header)[0]
+    if size > LIMIT:
+        raise ValueError('frame of %d bytes' % size)
+    data = _exactly(sock, size)
+    if data is None:
+        return None
+    return marshal.loads(data)
+
+def _exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+class Handler(SocketServer.BaseRequestHandler):
+    '''Answer requests of one client until it disconnects.'''
+    def setup(self):
+        with self.server.lock:
+            self.server.connections.add(self.request)
+
+    def finish(self):
+        with self.server.lock:
+            self.server.connections.discard(self.request)
+
+    def handle(self):
+        agent = self.server.agent
+        while True:
+            try:
+                request = receive(self.request)
+            except (socket.error, ValueError, EOFError):
+                return
+            if request is None:
+                return
+            try:
+                reply = (True, agent.call(*request))
+            except Exception, e:
+                reply = (False, '%s: %s' % (e.__class__.__name__, e))
+            try:
+                send(self.request, reply)
+            except socket.error:
+                return
+
+class Server(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, handler):
+        SocketServer.UnixStreamServer.__init__(self, path, handler)
+        self.lock = threading.Lock()
+        # Sockets of connected clients, closed by Agent.stop().
+        self.connections = set()
+
+class Agent(object):
+    '''
+    Collectors of system, the running one by default, cached for ttl
+    seconds, see cache.Cached, and served on path until stop().
+    '''
+    def __init__(self, path=SOCKET, system=None, ttl=None, default=5.0, mode=0600):
+        '''mode - permissions of the socket, 0666 lets every local user in'''
+        self.path = path
+        self.mode = mode
+        self.system = system or os.uname()[0]
+        self.collectors = {
+            'load': cache.Cached(getattr(load, self.system)(), ttl, default),
+            'storage': cache.Cached(getattr(storage, self.system)(), ttl, default),
+        }
+        self.server = None
+        self.thread = None
+
+    def call(self, module, name, args=(), kwargs=None):
+        '''Result of collector module's method name, as sent to clients.'''
+        if module not in self.collectors:
+            raise ValueError('unknown module: %s' % module)
+        if not name.startswith(('get_', 'parse_')):
+            raise AttributeError(name)
+        # Arguments are part of cache.Cached keys.
+        args = _hashable(args)
+        kwargs = dict([(k, _hashable(v)) for k, v in (kwargs or {}).items()])
+        result = getattr(self.collectors[module], name)(*args, **kwargs)
+        return encode(result)
+
+    def start(self):
+        '''Serve in a background thread.'''
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0755)
+        check_owner(self.path)
+        if os.path.exists(self.path):
+            # A socket left behind by an agent that did not stop.
+            probe = Client('load', self.path)
+            try:
+                probe.connect()
+            except socket.error:
+                os.unlink(self.path)
+            else:
+                probe.close()
+                raise RuntimeError('an agent is running on %s' % self.path)
+        self.server = Server(self.path, Handler)
+        self.server.agent = self
+        os.chmod(self.path, self.mode)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='wusu-agent')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            with self.server.lock:
+                for sock in self.server.connections:
+                    try:
+                        sock.shutdown(socket.SHUT_RDWR)
+                    except socket.error:
+                        pass
+            os.unlink(self.path)
+
+class Client(object):
+    '''
+    Stand-in for the agent's module collector ('load' or 'storage'):
+    its get_* and parse_* methods are called in the agent.
+    One connection is kept and shared by the client's threads.
+    '''
+    def __init__(self, module, path=SOCKET, timeout=None):
+        self.module = module
+        self.path = path
+        self.timeout = timeout
+        self.sock = None
+        self.lock = threading.Lock()
+
+    def connect(self):
+        check_owner(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except socket.error:
+            sock.close()
+            raise
+        self.sock = sock
+        return self
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def call(self, name, *args, **kwargs):
+        '''Call method name of the agent's collector.'''
+        request = (self.module, name, args, kwargs)
+        with self.lock:
+            # A connection the agent closed (restart) is noticed here, one retry.
+            for attempt in (0, 1):
+                try:
+                    if self.sock is None:
+                        self.connect()
+                    send(self.sock, request)
+                    reply = receive(self.sock)
+                    if reply is not None:
+                        break
+                except socket.error:
+                    if attempt:
+                        raise
+                self.close()
+            else:
+                raise socket.error('agent closed the connection')
+        ok, result = reply
+        if not ok:
+            raise AgentError(result)
+        return decode(result)
+
+    def __getattr__(self, name):
+        if not name.startswith(('get_', 'parse_')):
+            raise AttributeError(name)
+        def remote(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+        remote.__name__ = name
+        return remote
+
+if __name__ == '__main__':
+    Agent(len(sys.argv) > 1 and sys.argv[1] or SOCKET).start()
+    while True:
+        time.sleep(3600)
@@ -0,0 +1,414 @@
+'''
+Micro benchmarks for wusu collectors and parsers.
+Run as: python bench.py
+'''
+import timeit
+import time
+import sys
+import re
+import utils
+import records
+import history
+import samplelog
+import tempfile
+import json
+import os
+import load
+import storage
+import replay
+import mounts
+import procfile
+import nonblocking
+import exporter
+import agent
+import cgroups
+import urllib2
+import snapshot
+
+def bench(name, func, number=1000):
+    '''Time func() number times and print calls per second.'''
+    seconds = timeit.timeit(func, number=number)
+    print '%-40s %10.0f calls/s %10.1f us/call' % (name, number / seconds, seconds / number * 1e6)
+    return seconds
+
+def bench_ifstat(number=200):
+    '''Compare /proc/net/dev reader with `ip -s -o link`.'''
+    a = load.Linux()
+    bench('ifstat: ip -s -o link', lambda: utils.parser_ifstat_linux(utils.run('ip -s -o link')), number)
+    bench('ifstat: /proc/net/dev', a.parse_ifstat, number)
+
+def bench_fsusage(number=200):
+    '''Compare two df runs with a single statvfs pass over mountinfo.'''
+    a = storage.Linux()
+    fields = ('size', 'used', 'free', 'percent', 'mount')
+    def df():
+        utils.parser_storage(utils.run('df -k -P'), fields)
+        utils.parser_storage(utils.run('df -i -P'), fields)
+    bench('fsusage+inodes: df -k, df -i', df, number)
+    bench('fsusage+inodes: statvfs', a.parse_filesystems, number)
+
+def parser_memory_regex(data, fields):
+    '''parser_memory() as it was, one re.match per line and field.'''
+    parsed = {}
+    data = data.split('\n')
+    for item in data:
+        for field in fields:
+            if re.match(field, item):
+                parsed[item.split()[0][:-1]] = item.split()[1]
+    return parsed
+
+def bench_memory(number=5000):
+    '''Compare single pass parser_memory with the regex one.'''
+    data = load.Linux().get_memory()
+    fields = ('MemTotal', 'MemFree', 'MemAvailable', 'Buffers', 'Cached', 'SwapTotal', 'SwapFree')
+    bench('memory: re.match per line and field', lambda: parser_memory_regex(data, fields), number)
+    bench('memory: single pass', lambda: utils.parser_memory(data, fields), number)
+    bench('memory: single pass, all fields', lambda: utils.parser_memory(data), number)
+
+def sizeof(obj):
+    '''Deep size of parser results in bytes, shared strings counted once.'''
+    seen = set()
+    def size(obj):
+        if id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        total = sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            total += sum([size(k) + size(v) for k, v in obj.items()])
+        elif isinstance(obj, records.Record):
+            total += sum([size(v) for v in obj.values()])
+        return total
+    return size(obj)
+
+def netdev(count):
+    '''Synthetic /proc/net/dev with count interfaces.'''
+    lines = ['Inter-|   Receive |  Transmit', ' face |bytes packets ...|bytes packets ...']
+    for i in range(count):
+        lines.append('veth%d: %d %d 0 0 0 0 0 0 %d %d 0 0 0 0 0 0' % (i, i * 1000, i, i * 2000, i * 2))
+    return '\n'.join(lines) + '\n'
+
+def bench_typed(count=5000, number=20):
+    '''Compare memory and parse time of dict and typed results.'''
+    data = netdev(count)
+    def convert():
+        # What consumers of string results do.
+        for iface in utils.parser_netdev(data).values():
+            for counters in iface.values():
+                for key in counters:
+                    counters[key] = int(counters[key])
+    bench('netdev %d ifaces: dicts of strings' % count, lambda: utils.parser_netdev(data), number)
+    bench('netdev %d ifaces: dicts, int() after' % count, convert, number)
+    bench('netdev %d ifaces: typed records' % count, lambda: utils.parser_netdev(data, True), number)
+    print '%-40s %10d bytes' % ('netdev %d ifaces: dicts of strings' % count, sizeof(utils.parser_netdev(data)))
+    print '%-40s %10d bytes' % ('netdev %d ifaces: typed records' % count, sizeof(utils.parser_netdev(data, True)))
+
+def bench_history(count=2000, samples=50):
+    '''Insert throughput and memory of History with count series.'''
+    h = history.History()
+    names = ['iostat.dev%d.tps' % i for i in range(count)]
+    def insert():
+        now = insert.time
+        insert.time += 1
+        for name in names:
+            h.add(name, now, 1.5)
+    insert.time = 0
+    seconds = bench('history: %d series insert round' % count, insert, samples)
+    print '%-40s %10.0f samples/s' % ('history: insert throughput', count * samples / seconds)
+    print '%-40s %10d bytes' % ('history: %d series buffers' % count, h.nbytes())
+    bench('history: 1 minute range query', lambda: h.query(names[0], 10, 40), 10000)
+
+def bench_samplelog(columns=200, samples=3600):
+    '''Compare the binary sample log with JSON lines, one hour of 1 second samples.'''
+    names = ['iostat.dev%d.tps' % i for i in range(columns)]
+    row = dict([(n, 1.5) for n in names])
+    tmp = tempfile.mkdtemp()
+    log = samplelog.SampleLog(os.path.join(tmp, 'log'), names, max_bytes=1 << 40)
+    def binary():
+        for t in xrange(samples):
+            log.append(t, row)
+        log.flush()
+    f = open(os.path.join(tmp, 'log.json'), 'w')
+    def jsonlines():
+        for t in xrange(samples):
+            f.write(json.dumps({'time': t, 'values': row}) + '\n')
+        f.flush()
+    bench('samplelog: write %d x %d binary' % (samples, columns), binary, 1)
+    bench('samplelog: write %d x %d json lines' % (samples, columns), jsonlines, 1)
+    print '%-40s %10d bytes' % ('samplelog: binary file', os.path.getsize(log.path))
+    print '%-40s %10d bytes' % ('samplelog: json lines file', os.path.getsize(f.name))
+    reader = samplelog.Reader(log.path)
+    bench('samplelog: scan 10 minutes, all columns', lambda: list(reader.scan(600, 1200)), 10)
+    bench('samplelog: one column, whole file', lambda: reader.column(names[0]), 10)
+    reader.close()
+    log.close()
+    f.close()
+    for name in os.listdir(tmp):
+        os.remove(os.path.join(tmp, name))
+    os.rmdir(tmp)
+
+def bench_parsers(count=10000, number=5):
+    '''
+    Parse throughput of parse_* methods returning tables (interfaces,
+    devices, mounts, swap areas) on synthetic output of every supported
+    system, count rows long, see replay.synthetic().
+    '''
+    for module, sysname in replay.systems():
+        fixture = replay.synthetic(module, sysname, count)
+        collector = replay.replay(fixture)
+        for name in sorted(dir(collector)):
+            if not name.startswith('parse_') or name == 'parse_memory_usage' and sysname != 'Linux':
+                continue
+            method = getattr(collector, name)
+            parsed = method()
+            # parse_filesystems() returns (fsusage, inodes).
+            if isinstance(parsed, tuple) and parsed and isinstance(parsed[0], dict):
+                parsed = parsed[0]
+            if not isinstance(parsed, dict) or len(parsed) < count:
+                continue
+            seconds = timeit.timeit(method, number=number) / number
+            rows = len(parsed)
+            print '%-40s %10.0f rows/s %10.1f ms/call' % ('%s.%s.%s' % (module, sysname, name),
+                rows / seconds, seconds * 1e3)
+
+def bench_filters(count=10000, number=10):
+    '''Compare filtering interfaces in the parser with dropping them afterwards.'''
+    data = netdev(count) + 'eth0: 1 2 0 0 0 0 0 0 3 4 0 0 0 0 0 0\n'
+    match = utils.matcher(exclude=('veth*',))
+    def after():
+        parsed = utils.parser_netdev(data)
+        for name in parsed.keys():
+            if name.startswith('veth'):
+                del parsed[name]
+        return parsed
+    bench('netdev %d veths: drop after parsing' % count, after, number)
+    bench('netdev %d veths: exclude in parser' % count, lambda: utils.parser_netdev(data, match=match), number)
+
+def bench_mounts(number=10000):
+    '''Compare reading mountinfo every time with the change-driven MountTable.'''
+    def read():
+        f = open('/proc/self/mountinfo', 'r', 0)
+        utils.parser_mountinfo(f.read())
+        f.close()
+    table = mounts.table()
+    bench('mounts: read and parse mountinfo', read, number)
+    bench('mounts: MountTable, unchanged', table.mounts, number)
+
+def read(path):
+    '''Read a /proc file as load.Linux did, open, read and close.'''
+    f = open(path, 'r', 0)
+    data = f.read()
+    f.close()
+    return data
+
+def bench_procfile(number=20000):
+    '''Compare reading /proc files with open/read/close and with kept open ProcFiles.'''
+    a = load.Linux()
+    fields = ('MemTotal', 'MemFree')
+    bench('uptime: open, read, close', lambda: float(read('/proc/uptime').split()[0]), number)
+    bench('uptime: ProcFile.words()', a.get_uptime, number)
+    bench('loadavg: open, read, close', lambda: read('/proc/loadavg'), number)
+    bench('loadavg: ProcFile.read()', a.get_loadavg, number)
+    bench('meminfo: open, read, close', lambda: read('/proc/meminfo'), number)
+    bench('meminfo: ProcFile.read()', a.get_memory, number)
+    bench('parse_memory: open, read, close', lambda: utils.parser_memory(read('/proc/meminfo'), fields), number)
+    bench('parse_memory: ProcFile.lines()', a.parse_memory, number)
+    # seq_file of several pages, filled by more than one read.
+    smaps = procfile.ProcFile('/proc/self/smaps')
+    bench('smaps: open, read, close', lambda: read('/proc/self/smaps'), number / 10)
+    bench('smaps: ProcFile.read()', smaps.read, number / 10)
+    smaps.close()
+
+def bench_cpustat(counts=(8, 64, 256, 1024), number=200):
+    '''Per-CPU usage from synthetic /proc/stat of count CPUs, NumPy is used when installed.'''
+    for count in counts:
+        a = load.Linux()
+        data = replay.synthetic('load', 'Linux', count)['outputs']['get_cpustat']
+        bench('cpustat: %d CPUs (%s)' % (count, load.numpy and 'numpy' or 'array'),
+            lambda: a.parse_cpustat(data=data), number)
+
+def bench_processes(counts=(1000, 4000, 16000), number=3):
+    '''
+    Scan time of parse_processes() against process count, on a directory
+    tree laid out like /proc with synthetic stat, statm and io files.
+    '''
+    a = load.Linux()
+    bench('processes: ps -e (%d processes)' % len(a.get_processes(('stat',))),
+        lambda: utils.run('ps -e -o pid,ppid,nlwp,pcpu,vsz,rss,comm'), number)
+    for count in counts:
+        directory = tempfile.mkdtemp()
+        for pid, stat, statm, io in replay.synthetic('load', 'Linux', count)['outputs']['get_processes']:
+            os.mkdir(os.path.join(directory, pid))
+            for name, data in (('stat', stat), ('statm', statm), ('io', io)):
+                if data is not None:
+                    f = open(os.path.join(directory, pid, name), 'w')
+                    f.write(data)
+                    f.close()
+        a.proc = directory
+        bench('processes: all of %d' % count, a.parse_processes, number)
+        bench('processes: top 10 of %d' % count, lambda: a.parse_processes(top=10), number)
+        for pid in os.listdir(directory):
+            for name in os.listdir(os.path.join(directory, pid)):
+                os.remove(os.path.join(directory, pid, name))
+            os.rmdir(os.path.join(directory, pid))
+        os.rmdir(directory)
+
+def bench_exporter(number=500):
+    '''
+    Compare collecting and rendering a snapshot for every scrape with
+    scraping the exposition the exporter keeps between collections.
+    '''
+    e = exporter.Exporter(('127.0.0.1', 0), interval=3600).start()
+    url = 'http://127.0.0.1:%d/metrics' % e.server.server_address[1]
+    gzip = urllib2.Request(url, headers={'Accept-Encoding': 'gzip'})
+    bench('exporter: collect and render', e.collect, number)
+    bench('exporter: scrape cached', lambda: urllib2.urlopen(url).read(), number)
+    bench('exporter: scrape cached, gzip', lambda: urllib2.urlopen(gzip).read(), number)
+    e.stop()
+
+def bench_agent(delay=0.05, number=20):
+    '''
+    Compare FreeBSD parse_iostat calls with delay seconds per command,
+    collecting every time, with calls answered by an agent caching it.
+    '''
+    fixture = replay.synthetic('storage', 'FreeBSD', 100)
+    s = replay.replay(fixture)
+    s.get_iostat = delayed(s.get_iostat, delay)
+    path = os.path.join(tempfile.mkdtemp(), 'wusu.sock')
+    a = agent.Agent(path, 'FreeBSD', default=60)
+    a.collectors['storage'].collector = s
+    a.start()
+    client = agent.Client('storage', path)
+    bench('agent: parse_iostat collected', s.parse_iostat, number)
+    bench('agent: parse_iostat from agent', client.parse_iostat, number * 100)
+    client.close()
+    a.stop()
+    os.rmdir(os.path.dirname(path))
+
+def bench_cgroups(counts=(100, 1000), idle=0.9, number=20):
+    '''
+    Compare walking a cgroup tree and reading its files on every poll
+    with a cgroups.Tree, on a directory tree with synthetic cgroup files
+    where a share idle of the cgroups has no processes.
+    '''
+    for count in counts:
+        directory = tempfile.mkdtemp()
+        for path, files in replay.synthetic('load', 'Linux', count)['outputs']['get_cgroups'].items():
+            path = directory + path.rstrip('/')
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            files['cgroup.events'] = 'populated %d\nfrozen 0\n' % (hash(path) % 100 >= idle * 100)
+            for name, data in files.items():
+                f = open(os.path.join(path, name), 'w')
+                f.write(data)
+                f.close()
+        def walk():
+            for path, dirs, names in os.walk(directory):
+                for name in cgroups.FILES:
+                    if name in names:
+                        read(os.path.join(path, name))
+        tree = cgroups.Tree(directory)
+        bench('cgroups: walk and read %d' % count, walk, number)
+        bench('cgroups: Tree.collect() %d' % count, tree.collect, number)
+        tree.fallback()
+        bench('cgroups: Tree.collect() %d, no inotify' % count, tree.collect, number)
+        for path, dirs, names in os.walk(directory, topdown=False):
+            for name in names:
+                os.remove(os.path.join(path, name))
+            os.rmdir(path)
+
+def delayed(get, delay):
+    '''get, taking delay seconds like a forked command.'''
+    def slow(*args, **kwargs):
+        time.sleep(delay)
+        return get(*args, **kwargs)
+    return slow
+
+def bench_snapshot(delay=0.05, number=5):
+    '''
+    Compare calling every FreeBSD collector in turn with a snapshot, on
+    replayed output with delay seconds added to every command.
+    '''
+    collectors = []
+    for module in ('load', 'storage'):
+        fixture = replay.synthetic(module, 'FreeBSD', 100)
+        collector = replay.replay(fixture)
+        for name in fixture['outputs']:
+            setattr(collector, name, delayed(getattr(collector, name), delay))
+        collectors.append(collector)
+    a, s = collectors
+    def serial():
+        for method in (a.parse_uptime, a.parse_memory, a.parse_swap, a.parse_loadavg,
+                a.parse_ifstat, s.parse_fsusage, s.parse_inodes, s.parse_iostat):
+            method()
+    bench('FreeBSD collectors one after another', serial, number)
+    bench('FreeBSD snapshot', snapshot.Snapshot('FreeBSD', a, s).take, number)
+
+def scripted(collector, outputs, delay, directory):
+    '''
+    Point collector's commands at scripts printing outputs (replay
+    fixture outputs) after delay seconds.
+    '''
+    for name, output in outputs.items():
+        metric = name.split('_', 1)[1]
+        if not isinstance(getattr(collector, metric, None), basestring):
+            continue
+        data = os.path.join(directory, metric)
+        f = open(data, 'w')
+        f.write(output)
+        f.close()
+        script = data + '.sh'
+        f = open(script, 'w')
+        f.write('sleep %s\ncat %s\n' % (delay, data))
+        f.close()
+        setattr(collector, metric, 'sh %s' % script)
+    return collector
+
+def bench_nonblocking(count=20, delay=0.05, number=1):
+    '''
+    Compare parsing swap, ifstat and iostat of count FreeBSD hosts one
+    after another with all of them in flight on a nonblocking.Loop.
+    Commands are scripts printing synthetic output after delay seconds.
+    '''
+    directory = tempfile.mkdtemp()
+    outputs = {}
+    for module in ('load', 'storage'):
+        outputs.update(replay.synthetic(module, 'FreeBSD', 100)['outputs'])
+    calls = []
+    for i in range(count):
+        a = scripted(load.FreeBSD(), outputs, delay, directory)
+        s = scripted(storage.FreeBSD(), outputs, delay, directory)
+        calls.extend([(a, 'parse_swap'), (a, 'parse_ifstat'), (s, 'parse_iostat')])
+    def serial():
+        for collector, name in calls:
+            getattr(collector, name)()
+    def inflight():
+        loop = nonblocking.Loop()
+        requests = [loop.submit(collector, name) for collector, name in calls]
+        loop.wait(requests)
+        for r in requests:
+            if r.error is not None:
+                raise r.error
+    bench('%d collections one after another' % len(calls), serial, number)
+    bench('%d collections in flight' % len(calls), inflight, number)
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+if __name__ == '__main__':
+    bench_ifstat()
+    bench_fsusage()
+    bench_memory()
+    bench_typed()
+    bench_history()
+    bench_samplelog()
+    bench_parsers()
+    bench_filters()
+    bench_mounts()
+    bench_procfile()
+    bench_cpustat()
+    bench_processes()
+    bench_cgroups()
+    bench_snapshot()
+    bench_exporter()
+    bench_agent()
+    bench_nonblocking()
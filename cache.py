@@ -0,0 +1,104 @@
+import threading
+import utils
+
+class Cached(object):
+    '''
+    Wrap a load.* or storage.* collector and cache results of its get_*
+    and parse_* methods for a number of seconds set per metric.
+
+    ttl maps method names or metric names (memory, swap, ...) to seconds:
+    Cached(load.Linux(), {'swap': 300, 'uptime': 60, 'ifstat': 1})
+    Metrics not listed in ttl are cached for default seconds.
+
+    When several threads ask for the same result while it is being
+    collected, only one of them collects it and the others wait for
+    its result (or exception) instead of collecting it themselves.
+
+    Calls with different arguments are cached separately. Callers share
+    the returned objects, so they must not modify them.
+    '''
+    def __init__(self, collector, ttl=None, default=5.0):
+        self.collector = collector
+        self.ttl = ttl or {}
+        self.default = default
+        self.lock = threading.Lock()
+        # key: (expiry time, see utils.monotonic(), result)
+        self.results = {}
+        # key: event set when the collecting thread is done
+        self.inflight = {}
+        # hits - answered from cache, misses - collected,
+        # shared - answered by waiting for another thread's collection
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.collector, name)
+        if not callable(attr) or not name.startswith(('get_', 'parse_')):
+            return attr
+        def cached(*args, **kwargs):
+            return self.call(name, *args, **kwargs)
+        cached.__name__ = name
+        cached.__doc__ = attr.__doc__
+        return cached
+
+    def lifetime(self, name):
+        '''Seconds results of method name are kept for.'''
+        if name in self.ttl:
+            return self.ttl[name]
+        metric = name.split('_', 1)[1]
+        return self.ttl.get(metric, self.default)
+
+    def call(self, name, *args, **kwargs):
+        '''Return a cached result of collector.name(*args, **kwargs).'''
+        key = (name, args, tuple(sorted(kwargs.items())))
+        with self.lock:
+            if key in self.results:
+                expiry, result = self.results[key]
+                if expiry > utils.monotonic():
+                    self.hits += 1
+                    return result
+                del self.results[key]
+            done = self.inflight.get(key)
+            collect = done is None
+            if collect:
+                done = self.inflight[key] = threading.Event()
+                self.misses += 1
+            else:
+                self.shared += 1
+        if not collect:
+            done.wait()
+            failed, result = done.outcome
+            if failed:
+                raise result
+            return result
+        try:
+            result = getattr(self.collector, name)(*args, **kwargs)
+        except Exception, e:
+            done.outcome = (True, e)
+            with self.lock:
+                del self.inflight[key]
+            done.set()
+            raise
+        done.outcome = (False, result)
+        with self.lock:
+            self.results[key] = (utils.monotonic() + self.lifetime(name), result)
+            del self.inflight[key]
+        done.set()
+        return result
+
+    def invalidate(self, name=None):
+        '''Drop cached results of method name, or all of them.'''
+        with self.lock:
+            for key in self.results.keys():
+                if name is None or key[0] == name:
+                    del self.results[key]
+
+    def stats(self):
+        '''
+        Returned structure is a dictionary:
+        {'hits': value, 'misses': value, 'shared': value, 'cached': value}
+        '''
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                'shared': self.shared, 'cached': len(self.results)}
@@ -0,0 +1,377 @@
+'''
+Linux cgroup v2 hierarchy, walked once and then followed through changes.
+
+Tree lists the hierarchy at start and keeps a Group for every cgroup.
+Files are read through procfile.ProcFile instances kept open, up to a
+limit of handles for the whole tree; files past it are opened for every
+read. Later calls do not walk the hierarchy again: cgroups created and
+removed are picked up from inotify(7) events, or, where inotify is not
+available, from the link count of the directories, which counts their
+subdirectories (kernfs does not update the modification time). inotify
+also reports changes of cgroup.events, so files that only change while a
+cgroup has processes (cpu.stat) are not read again while it has none.
+Pressure files are read every time, their averages decay while idle.
+'''
+import collections
+import resource
+import threading
+import struct
+import errno
+import os
+import mounts
+import procfile
+
+FILES = ('cpu.stat', 'memory.current', 'memory.stat', 'io.stat',
+    'cpu.pressure', 'memory.pressure', 'io.pressure')
+# Files that do not change while a cgroup and its descendants have no processes.
+# Not *.pressure, the averages decay while nothing stalls.
+_busy = ('cpu.stat',)
+
+# From sys/inotify.h.
+IN_MODIFY = 0x2
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_ONLYDIR = 0x1000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 02000000
+IN_NONBLOCK = 04000
+
+_event = struct.Struct('iIII')
+_trees = {}
+_lock = threading.Lock()
+
+def root():
+    '''Mount point of the cgroup2 hierarchy, None if it is not mounted.'''
+    for device, mount, fstype in mounts.table().mounts(fstypes=('cgroup2',)):
+        return mount
+    return None
+
+def tree(path=None):
+    '''Tree of the hierarchy mounted on path, root() by default, shared by all callers.'''
+    path = path or root()
+    if path is None:
+        raise IOError(errno.ENOENT, 'cgroup2 is not mounted')
+    with _lock:
+        if path not in _trees:
+            _trees[path] = Tree(path)
+        return _trees[path]
+
+class Inotify(object):
+    '''inotify(7) through libc, raises OSError where it is not available.'''
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except (OSError, AttributeError):
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        if self.fd < 0:
+            self.error()
+
+    def error(self):
+        import ctypes
+        code = ctypes.get_errno()
+        raise OSError(code, os.strerror(code))
+
+    def add(self, path, mask):
+        '''Watch directory path, return the watch descriptor.'''
+        wd = self.libc.inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            self.error()
+        return wd
+
+    def remove(self, wd):
+        # Watches of removed directories are gone already.
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self):
+        '''
+        Events since the last call, without waiting.
+        Returned structure is a list of tuples:
+        [(wd, mask, name), ...]
+        '''
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError, e:
+                if e.errno == errno.EAGAIN:
+                    return events
+                raise
+            offset = 0
+            while offset < len(data):
+                wd, mask, cookie, size = _event.unpack_from(data, offset)
+                offset += _event.size
+                events.append((wd, mask, data[offset:offset + size].rstrip('\0')))
+                offset += size
+
+    def close(self):
+        os.close(self.fd)
+
+def _read(path):
+    '''Content of path with open(2), read(2) until it returns nothing, close(2).'''
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        chunks = []
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                return ''.join(chunks)
+            chunks.append(chunk)
+    finally:
+        os.close(fd)
+
+class Handles(object):
+    '''
+    Open procfile.ProcFile instances, at most limit of them. Files read
+    while limit are open are opened, read and closed every time; keeping
+    the open ones, instead of closing the least recently used, avoids
+    reopening every file when all of them are read in turn. The default
+    limit is 256, or a quarter of the descriptors the process may open if
+    that is less. Running out of descriptors anyway (EMFILE, ENFILE)
+    closes the least recently used half and tries again once.
+    '''
+    def __init__(self, limit=None):
+        if limit is None:
+            soft = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+            limit = soft == resource.RLIM_INFINITY and 256 or max(min(256, soft / 4), 1)
+        self.limit = limit
+        self.lock = threading.Lock()
+        # path: ProcFile, least recently used first
+        self.files = collections.OrderedDict()
+
+    def _evict(self, count):
+        for i in range(min(count, len(self.files))):
+            self.files.popitem(last=False)[1].close()
+
+    def read(self, path):
+        '''Content of path, raises IOError or OSError as open(2) and read(2) do.'''
+        with self.lock:
+            f = self.files.pop(path, None)
+            if f is None:
+                try:
+                    if len(self.files) >= self.limit:
+                        return _read(path)
+                    f = procfile.ProcFile(path)
+                except (IOError, OSError), e:
+                    if e.errno not in (errno.EMFILE, errno.ENFILE) or not self.files:
+                        raise
+                    self._evict(max(len(self.files) / 2, 1))
+                    return _read(path)
+            self.files[path] = f
+            try:
+                return f.read()
+            except (IOError, OSError):
+                del self.files[path]
+                f.close()
+                raise
+
+    def forget(self, directory):
+        '''Close the files of directory.'''
+        with self.lock:
+            for path in self.files.keys():
+                if os.path.dirname(path) == directory:
+                    self.files.pop(path).close()
+
+class Group(object):
+    '''One cgroup and what its files held when last read.'''
+    def __init__(self, path, directory, handles):
+        self.path = path
+        self.directory = directory
+        self.handles = handles
+        # Files the cgroup does not have (controller not enabled).
+        self.missing = set()
+        # name: data of the last read
+        self.cache = {}
+        self.children = set()
+        self.wd = None
+        # (st_mtime, st_nlink) of directory, see Tree.refresh().
+        self.stamp = None
+        # None when unknown (root, no inotify), see Tree.collect().
+        self.populated = None
+        self.events = True
+
+    def read(self, name):
+        '''
+        Content of file name, None if the cgroup does not have it or it
+        could not be read this time (out of descriptors, cgroup removed).
+        '''
+        if name in self.missing:
+            return None
+        try:
+            return self.handles.read(os.path.join(self.directory, name))
+        except (IOError, OSError), e:
+            if e.errno in (errno.ENOENT, errno.EOPNOTSUPP) and os.path.isdir(self.directory):
+                self.missing.add(name)
+            return None
+
+    def close(self):
+        self.handles.forget(self.directory)
+
+class Tree(object):
+    '''
+    Groups of the hierarchy mounted on root, keyed by cgroup path as
+    in /proc/<pid>/cgroup: '/', '/system.slice', ...
+    At most handles files are kept open, see Handles.
+    '''
+    def __init__(self, root, handles=None):
+        self.root = root
+        self.handles = Handles(handles)
+        self.lock = threading.Lock()
+        self.groups = {}
+        # wd: path
+        self.watches = {}
+        try:
+            self.inotify = Inotify()
+        except OSError:
+            self.inotify = None
+        with self.lock:
+            self.add('/')
+
+    def directory(self, path):
+        return self.root + path.rstrip('/')
+
+    def _stamp(self, directory):
+        st = os.stat(directory)
+        return st.st_mtime, st.st_nlink
+
+    def _subdirs(self, directory):
+        names = os.listdir(directory)
+        return set([n for n in names if os.path.isdir(os.path.join(directory, n))])
+
+    def add(self, path):
+        '''Add the cgroup at path and its descendants. Callers hold lock.'''
+        if path in self.groups:
+            return
+        group = Group(path, self.directory(path), self.handles)
+        # Watch first, children created while listing are not missed.
+        if self.inotify is not None:
+            try:
+                group.wd = self.inotify.add(group.directory, IN_CREATE | IN_DELETE | IN_MODIFY | IN_ONLYDIR)
+                self.watches[group.wd] = path
+            except OSError, e:
+                if e.errno == errno.ENOENT:
+                    return
+                # Out of watches (fs.inotify.max_user_watches).
+                self.fallback()
+        try:
+            group.stamp = self._stamp(group.directory)
+            names = self._subdirs(group.directory)
+        except OSError:
+            # Removed meanwhile.
+            if group.wd is not None:
+                self.watches.pop(group.wd, None)
+            return
+        self.groups[path] = group
+        parent = self.groups.get(os.path.dirname(path))
+        if parent is not None and parent is not group:
+            parent.children.add(os.path.basename(path))
+        for name in names:
+            self.add(path.rstrip('/') + '/' + name)
+
+    def remove(self, path):
+        '''Drop the cgroup at path and its descendants. Callers hold lock.'''
+        group = self.groups.pop(path, None)
+        if group is None:
+            return
+        for name in list(group.children):
+            self.remove(path.rstrip('/') + '/' + name)
+        parent = self.groups.get(os.path.dirname(path))
+        if parent is not None:
+            parent.children.discard(os.path.basename(path))
+        if group.wd is not None and self.inotify is not None:
+            self.watches.pop(group.wd, None)
+            self.inotify.remove(group.wd)
+        group.close()
+
+    def sync(self, group):
+        '''Compare group's children with its directory. Callers hold lock.'''
+        try:
+            names = self._subdirs(group.directory)
+        except OSError:
+            self.remove(group.path)
+            return
+        for name in group.children - names:
+            self.remove(group.path.rstrip('/') + '/' + name)
+        for name in names - group.children:
+            self.add(group.path.rstrip('/') + '/' + name)
+
+    def fallback(self):
+        '''Stop using inotify, follow directory link counts instead.'''
+        self.inotify.close()
+        self.inotify = None
+        self.watches = {}
+        for group in self.groups.values():
+            group.wd = None
+            group.populated = None
+
+    def refresh(self):
+        '''Apply changes of the hierarchy since the last call.'''
+        with self.lock:
+            if self.inotify is not None:
+                for wd, mask, name in self.inotify.read():
+                    if mask & IN_Q_OVERFLOW:
+                        # Events were lost, compare every cgroup with its directory.
+                        for group in self.groups.values():
+                            group.events = True
+                            if group.path in self.groups:
+                                self.sync(group)
+                        continue
+                    path = self.watches.get(wd)
+                    if path not in self.groups:
+                        continue
+                    child = path.rstrip('/') + '/' + name
+                    if mask & IN_ISDIR and mask & IN_CREATE:
+                        self.add(child)
+                    elif mask & IN_ISDIR and mask & IN_DELETE:
+                        self.remove(child)
+                    elif mask & IN_MODIFY and name == 'cgroup.events':
+                        self.groups[path].events = True
+                return
+            for group in self.groups.values():
+                if group.path not in self.groups:
+                    # Removed with its parent.
+                    continue
+                try:
+                    stamp = self._stamp(group.directory)
+                except OSError:
+                    self.remove(group.path)
+                    continue
+                if stamp != group.stamp:
+                    group.stamp = stamp
+                    self.sync(group)
+
+    def collect(self, files=FILES, match=None):
+        '''
+        Content of files of every cgroup accepted by match, see
+        utils.matcher(). Files a cgroup does not have are left out.
+        cpu.stat of cgroups without processes is the one read when they
+        last had some.
+        Returned structure is a dictionary of dictionaries:
+        {path: {file: data, ...}}
+        '''
+        self.refresh()
+        with self.lock:
+            groups = self.groups.values()
+            inotify = self.inotify is not None
+        collected = {}
+        for group in groups:
+            if match and not match(group.path):
+                continue
+            if group.events and inotify:
+                group.events = False
+                events = group.read('cgroup.events')
+                if events is not None:
+                    group.populated = 'populated 1' in events
+            data = {}
+            for name in files:
+                if group.populated is False and name in _busy and name in group.cache:
+                    value = group.cache[name]
+                else:
+                    value = group.cache[name] = group.read(name)
+                if value is not None:
+                    data[name] = value
+            collected[group.path] = data
+        return collected
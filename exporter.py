@@ -0,0 +1,206 @@
+'''
+Prometheus exporter serving snapshots in the text exposition format.
+
+Metrics are collected on the exporter's own schedule, not per scrape.
+Every collection is rendered once and kept as bytes, plain and gzipped,
+so any number of scrapers read the same body without forking df or
+iostat again:
+
+    exporter.Exporter(('', 9101), interval=15).start()
+
+or from the shell:
+
+    python exporter.py [port [interval]]
+
+Table metrics get their rows as labels, one for every level of nesting,
+and text values of a row (mount points) as more labels:
+    wusu_fsusage_used{filesystem="/dev/vda",mount="/"} 18439328.0
+    wusu_ifstat_in_bytes{interface="eth0"} 58346092.0
+    wusu_ifstat_in_bytes{interface="em0",address="10.0.0.1"} 58346092.0
+'''
+import SocketServer
+import BaseHTTPServer
+import threading
+import time
+import zlib
+import sys
+import re
+import scheduler
+import snapshot
+
+# Labels of the rows of table metrics, one for every level of nesting.
+_labels = {'ifstat': ('interface',), 'iostat': ('device',), 'swap': ('device',),
+    'fsusage': ('filesystem',), 'inodes': ('filesystem',)}
+# Systems nesting rows deeper: FreeBSD reports every address of an interface.
+_system_labels = {('FreeBSD', 'ifstat'): ('interface', 'address')}
+# Names of tuple members, None for members not exported.
+_tuples = {'uptime': (None, None, None, None, 'seconds'), 'loadavg': ('1m', '5m', '15m')}
+_invalid = re.compile(r'[^a-zA-Z0-9_]')
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _number(value):
+    try:
+        return float(str(value).rstrip('%'))
+    except ValueError:
+        return None
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _walk(samples, name, value, labels, rows=(), members=()):
+    '''
+    Add samples of value, a parse_* result, to samples.
+    rows - labels of the keys of value, a table, and of its nested tables
+    members - names of the members of value, a tuple
+    '''
+    if hasattr(value, 'items'):
+        items = value.items()
+        if rows:
+            for key, row in items:
+                _walk(samples, name, row, labels + ((rows[0], key),), rows[1:])
+            return
+        # Text values of a row label its numbers.
+        texts = [(k, v) for k, v in items if isinstance(v, basestring) and _number(v) is None]
+        labels = labels + tuple(texts)
+        for key, v in items:
+            if (key, v) not in texts:
+                _walk(samples, '%s_%s' % (name, key), v, labels)
+    elif isinstance(value, (tuple, list)):
+        for i, v in enumerate(value):
+            if not members:
+                _walk(samples, '%s_%d' % (name, i), v, labels)
+            elif i < len(members) and members[i] is not None:
+                _walk(samples, '%s_%s' % (name, members[i]), v, labels)
+    elif value is not None:
+        number = _number(value)
+        if number is not None:
+            samples.setdefault(_invalid.sub('_', name), []).append((labels, number))
+
+def render(snap, prefix='wusu'):
+    '''
+    Text exposition of snap, a snapshot.Snapshot.take() result, with
+    prefix_up{metric="..."} telling which metrics were collected and
+    prefix_collect_latency_seconds{metric="..."} how long they took.
+    '''
+    samples = {}
+    for metric, value in snap['metrics'].items():
+        rows = _system_labels.get((snap.get('system'), metric), _labels.get(metric, ()))
+        _walk(samples, '%s_%s' % (prefix, metric), value, (), rows, _tuples.get(metric, ()))
+        labels = (('metric', metric),)
+        samples.setdefault(prefix + '_up', []).append((labels, metric not in snap['errors'] and 1.0 or 0.0))
+        if metric in snap['latency']:
+            samples.setdefault(prefix + '_collect_latency_seconds', []).append((labels, snap['latency'][metric]))
+    samples[prefix + '_collect_duration_seconds'] = [((), snap['duration'])]
+    samples[prefix + '_collect_timestamp_seconds'] = [((), snap['time'])]
+    lines = []
+    for name in sorted(samples):
+        lines.append('# TYPE %s untyped' % name)
+        for labels, number in samples[name]:
+            if labels:
+                lines.append('%s{%s} %r' % (name, ','.join(['%s="%s"' % (_invalid.sub('_', str(k)), _escape(v))
+                    for k, v in labels]), number))
+            else:
+                lines.append('%s %r' % (name, number))
+    return '\n'.join(lines) + '\n'
+
+def gzipped(body):
+    '''body compressed in gzip format, for Content-Encoding: gzip.'''
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(body) + compressor.flush()
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''Serve the exporter's last exposition on /metrics.'''
+    # Keep-alive, scrapers reuse their connections.
+    protocol_version = 'HTTP/1.1'
+
+    def reply(self, code, body, headers=()):
+        self.send_response(code)
+        for header in headers:
+            self.send_header(*header)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def do_GET(self):
+        exporter = self.server.exporter
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.reply(404, 'Metrics are at /metrics\n', [('Content-Type', 'text/plain')])
+            return
+        exposition = exporter.exposition
+        if exposition is None:
+            self.reply(503, 'No collection yet\n', [('Content-Type', 'text/plain')])
+            return
+        body, compressed = exposition
+        headers = [('Content-Type', CONTENT_TYPE), ('Vary', 'Accept-Encoding')]
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = compressed
+            headers.append(('Content-Encoding', 'gzip'))
+        exporter.scrapes += 1
+        self.reply(200, body, headers)
+
+    do_HEAD = do_GET
+
+    def log_message(self, format, *args):
+        pass
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class Exporter(object):
+    '''
+    Collect a snapshot every interval seconds, on a scheduler.Scheduler,
+    and serve its exposition over HTTP until stop().
+    '''
+    def __init__(self, address=('', 9101), interval=15, metrics=None, collector=None, prefix='wusu'):
+        '''
+        metrics - snapshot metrics to export, all snapshot.METRICS by default
+        collector - snapshot.Snapshot to take snapshots with, a new one by default
+        '''
+        self.address = address
+        self.interval = interval
+        self.metrics = metrics
+        self.collector = collector or snapshot.Snapshot()
+        self.prefix = prefix
+        # (body, gzipped body) of the last collection, replaced as a whole.
+        self.exposition = None
+        self.scheduler = scheduler.Scheduler()
+        self.server = None
+        self.thread = None
+        self.collections = 0
+        self.scrapes = 0
+
+    def collect(self):
+        '''Take a snapshot and render it, returns the exposition body.'''
+        body = render(self.collector.take(self.metrics), self.prefix)
+        self.exposition = (body, gzipped(body))
+        self.collections += 1
+        return body
+
+    def start(self):
+        '''Collect once, then serve and collect in background threads.'''
+        self.collect()
+        self.scheduler.add(self.collect, self.interval, name='exporter')
+        self.scheduler.start()
+        self.server = Server(self.address, Handler)
+        self.server.exporter = self
+        self.thread = threading.Thread(target=self.server.serve_forever, name='wusu-exporter')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.scheduler.stop()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+
+if __name__ == '__main__':
+    port = len(sys.argv) > 1 and int(sys.argv[1]) or 9101
+    interval = len(sys.argv) > 2 and float(sys.argv[2]) or 15
+    Exporter(('', port), interval).start()
+    while True:
+        time.sleep(3600)
@@ -0,0 +1,187 @@
+from array import array
+import time
+import utils
+
+_nan = float('nan')
+
+class Ring(object):
+    '''
+    Fixed size ring buffer of rows of width floats, the first of which is a
+    timestamp. Rows live in a single preallocated array('d'), so memory
+    does not grow however many rows are appended.
+    '''
+    def __init__(self, size, width):
+        self.size = size
+        self.width = width
+        self.data = array('d', [_nan]) * (size * width)
+        # Index of the next row to write and number of valid rows.
+        self.head = 0
+        self.count = 0
+
+    def append(self, row):
+        offset = self.head * self.width
+        data = self.data
+        for value in row:
+            data[offset] = value
+            offset += 1
+        self.head = (self.head + 1) % self.size
+        if self.count < self.size:
+            self.count += 1
+
+    def _offset(self, i):
+        '''Array offset of the i-th oldest row.'''
+        return ((self.head - self.count + i) % self.size) * self.width
+
+    def _bisect(self, timestamp):
+        '''Index of the oldest row with time >= timestamp.'''
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.data[self._offset(mid)] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, start=None, end=None):
+        '''Rows with start <= time <= end, oldest first, as tuples.'''
+        first, last = 0, self.count
+        if start is not None:
+            first = self._bisect(start)
+        if end is not None:
+            last = self._bisect(end + 1e-9)
+        rows = []
+        for i in xrange(first, last):
+            offset = self._offset(i)
+            rows.append(tuple(self.data[offset:offset + self.width]))
+        return rows
+
+    def last(self):
+        if not self.count:
+            return None
+        offset = self._offset(self.count - 1)
+        return tuple(self.data[offset:offset + self.width])
+
+    def nbytes(self):
+        return self.data.buffer_info()[1] * self.data.itemsize
+
+class Rollup(object):
+    '''
+    Min, max and average of a series over buckets of width seconds,
+    updated on every insert. Finished buckets go to a Ring of
+    (bucket start, min, max, avg) rows.
+    '''
+    __slots__ = ('width', 'ring', 'bucket', 'min', 'max', 'sum', 'count')
+
+    def __init__(self, width, size):
+        self.width = width
+        self.ring = Ring(size, 4)
+        self.bucket = None
+        self.count = 0
+
+    def add(self, timestamp, value):
+        bucket = timestamp - timestamp % self.width
+        if bucket != self.bucket:
+            self.flush()
+            self.bucket = bucket
+            self.min = self.max = self.sum = value
+            self.count = 1
+            return
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.sum += value
+        self.count += 1
+
+    def flush(self):
+        if self.count:
+            self.ring.append((self.bucket, self.min, self.max, self.sum / self.count))
+            self.count = 0
+
+    def current(self):
+        '''The bucket being filled, or None.'''
+        if not self.count:
+            return None
+        return (self.bucket, self.min, self.max, self.sum / self.count)
+
+class Series(object):
+    '''Raw samples of one value plus its rollups.'''
+    __slots__ = ('raw', 'rollups', 'time')
+
+    def __init__(self, raw, tiers):
+        self.raw = Ring(raw, 2)
+        self.rollups = [Rollup(width, size) for width, size in tiers]
+        self.time = None
+
+class History(object):
+    '''
+    In-process time series store with constant memory.
+
+    Every series keeps its last raw samples and min/max/avg rollups over
+    the tiers given as (bucket seconds, number of buckets):
+    History(raw=300, tiers=((60, 360), (300, 288)))
+    keeps 300 raw samples, 6 hours of 1 minute and 1 day of 5 minute buckets.
+    All buffers are allocated when a series is first seen.
+    '''
+    def __init__(self, raw=300, tiers=((60, 360), (300, 288))):
+        self.raw = raw
+        self.tiers = tuple(tiers)
+        self.series = {}
+        # Samples older than the newest one in their series are dropped.
+        self.dropped = 0
+
+    def add(self, name, timestamp, value):
+        '''Add one sample to series name.'''
+        series = self.series.get(name)
+        if series is None:
+            series = self.series[name] = Series(self.raw, self.tiers)
+        if series.time is not None and timestamp < series.time:
+            self.dropped += 1
+            return
+        series.time = timestamp
+        value = float(value)
+        series.raw.append((timestamp, value))
+        for rollup in series.rollups:
+            rollup.add(timestamp, value)
+
+    def record(self, prefix, parsed, timestamp=None):
+        '''
+        Add every numeric value of a parse_* result as series named
+        prefix.key.key..., see utils.flatten(), e.g.
+        history.record('ifstat', load.Linux().parse_ifstat())
+        adds ifstat.eth0.in.bytes and so on.
+        '''
+        if timestamp is None:
+            timestamp = time.time()
+        for name, value in utils.flatten(parsed, prefix).items():
+            self.add(name, timestamp, value)
+
+    def query(self, name, start=None, end=None, tier=None):
+        '''
+        Samples of series name with start <= time <= end.
+        Without tier, raw (time, value) rows are returned. With tier set to
+        one of the bucket widths, (bucket start, min, max, avg) rows are
+        returned, the bucket being filled included.
+        '''
+        series = self.series[name]
+        if tier is None:
+            return series.raw.range(start, end)
+        for rollup in series.rollups:
+            if rollup.width == tier:
+                rows = rollup.ring.range(start, end)
+                current = rollup.current()
+                if current and (start is None or current[0] >= start) and (end is None or current[0] <= end):
+                    rows.append(current)
+                return rows
+        raise KeyError(tier)
+
+    def names(self):
+        return self.series.keys()
+
+    def nbytes(self):
+        '''Bytes allocated for sample buffers.'''
+        total = 0
+        for series in self.series.values():
+            total += series.raw.nbytes() + sum([r.ring.nbytes() for r in series.rollups])
+        return total
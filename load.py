@@ -1,77 +1,247 @@
+import records
 import utils
+import operator
+import heapq
+import array
 import os
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Fields of records returned by Linux.parse_processes().
+PROCESS_FIELDS = ('name', 'state', 'ppid', 'threads', 'cpu', 'utime', 'stime', 'vsize', 'rss',
+    'shared', 'text', 'data', 'read_bytes', 'write_bytes')
+# Fields of records returned by Linux.parse_cpustat(), the first columns of /proc/stat.
+CPU_FIELDS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal')
+# Process fields read from /proc/<pid>/stat: index in utils.parser_pidstat() fields.
+_stat_fields = {'ppid': 1, 'utime': 11, 'stime': 12, 'threads': 17, 'vsize': 20, 'rss': 21}
+
+def _readproc(path):
+    '''
+    Content of a small /proc file with open(2), one read(2) and close(2),
+    None if it can not be read (process gone, io of another user's process).
+    '''
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        return os.read(fd, 4096)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
 
 class Linux(object):
+    '''
+    /proc files are kept open and read again on every call,
+    see procfile.ProcFile.
+    '''
     def __init__(self):
+        self.uptime = '/proc/uptime'
         self.memory = '/proc/meminfo'
         self.swap = '/proc/swaps'
         self.loadavg = '/proc/loadavg'
-        self.ifstat = 'ip -s -o link'
+        self.ifstat = '/proc/net/dev'
+        self.netclass = '/sys/class/net/%s'
         self.pagesize = os.sysconf('SC_PAGE_SIZE')
+        self.kinds = {}
+        self.stat = '/proc/stat'
+        # (names, counters) of the last parse_cpustat(), counters being
+        # the CPU_FIELDS columns of all CPUs in one array.
+        self.cputicks = None
+        self.proc = '/proc'
+        self.pressure = '/proc/pressure/%s'
+        # cgroup2 mount point, found by the first get_cgroups() if not set.
+        self.cgroup = None
+        self.clktck = os.sysconf('SC_CLK_TCK')
+        # {pid: (starttime, cputime)} in clock ticks, and uptime of the last
+        # parse_processes(), for CPU usage between two calls.
+        self.cputimes = {}
+        self.cputimes_at = None
 
     def get_uptime(self):
         '''
         Get machine uptime in seconds as provided by /proc/uptime.
         Also see parse_uptime().
         '''
-        f = open('/proc/uptime', 'r', 0)
-        seconds = float(f.read().split()[0])
-        f.close()
-        return seconds
+        import procfile
+        return float(procfile.get(self.uptime).words(1)[0])
 
-    def get_memory(self):
+    def get_memory(self, fields=None):
         '''
         Get memory information from /proc/meminfo.
+        With fields, only lines of these keys are returned.
         Also see parse_memory().
         '''
-        f = open(self.memory, 'r', 0)
-        data = f.read()
-        f.close()
-        return data
+        import procfile
+        if fields is not None:
+            return procfile.get(self.memory).lines(fields)
+        return procfile.get(self.memory).read()
 
     def get_swap(self):
         '''
         Get swap information from /proc/swaps.
         Also see parse_swap().
         '''
-        f = open(self.swap, 'r', 0)
-        data = f.read()
-        f.close()
-        return data
+        import procfile
+        return procfile.get(self.swap).read()
 
     def get_loadavg(self):
         '''Get load information from /proc/loadavg.'''
-        f = open(self.loadavg, 'r', 0)
-        data = f.read()
-        f.close()
-        return data
+        import procfile
+        return procfile.get(self.loadavg).read()
 
     def get_ifstat(self):
-        '''Get interface statistics.'''
-        return utils.run(self.ifstat)
+        '''
+        Get interface statistics from /proc/net/dev.
+        Also see parse_ifstat().
+        '''
+        import procfile
+        return procfile.get(self.ifstat).read()
+
+    def get_cpustat(self):
+        '''
+        Get the cpu lines of /proc/stat.
+        Also see parse_cpustat().
+        '''
+        import procfile
+        return procfile.get(self.stat).head('intr')
 
-    def parse_uptime(self):
+    def get_pressure(self):
+        '''
+        Get pressure stall information of the host from /proc/pressure/.
+        Also see parse_pressure().
+        Returned structure is a dictionary:
+        {resource: data}
+        '''
+        import procfile
+        pressure = {}
+        for resource in ('cpu', 'memory', 'io'):
+            try:
+                pressure[resource] = procfile.get(self.pressure % resource).read()
+            except IOError:
+                # Kernels without PSI, or booted with psi=0.
+                pass
+        return pressure
+
+    def get_cgroups(self, files=None, match=None):
+        '''
+        Get files, cgroups.FILES by default, of every cgroup v2 cgroup,
+        see cgroups.Tree.collect(). The hierarchy is walked by the first
+        call only. Also see parse_cgroups().
+        Returned structure is a dictionary of dictionaries:
+        {path: {file: data, ...}}
+        '''
+        import cgroups
+        if files is None:
+            files = cgroups.FILES
+        return cgroups.tree(self.cgroup).collect(files, match)
+
+    def get_kind(self, interface):
+        '''
+        Kind of interface, from sysfs: 'loopback', 'bridge', 'bond', 'tun',
+        'physical' (backed by a device) or 'virtual' (veth, dummy, ...).
+        '''
+        if interface not in self.kinds:
+            # Short lived interfaces (containers) come and go, do not keep all of them.
+            if len(self.kinds) > 4096:
+                self.kinds.clear()
+            path = self.netclass % interface
+            try:
+                f = open(path + '/type', 'r', 0)
+                arptype = f.read().strip()
+                f.close()
+            except IOError:
+                arptype = ''
+            if arptype == '772':
+                kind = 'loopback'
+            elif os.path.exists(path + '/bridge'):
+                kind = 'bridge'
+            elif os.path.exists(path + '/bonding'):
+                kind = 'bond'
+            elif os.path.exists(path + '/tun_flags'):
+                kind = 'tun'
+            elif os.path.exists(path + '/device'):
+                kind = 'physical'
+            else:
+                kind = 'virtual'
+            self.kinds[interface] = kind
+        return self.kinds[interface]
+
+    def get_processes(self, files=('stat', 'statm', 'io'), pids=None):
+        '''
+        Get /proc/<pid>/ files of all processes, or of pids.
+        Processes exiting during the scan are left out, files that can
+        not be read (io of other users' processes) are None, as are
+        files not in files.
+        Also see parse_processes().
+        Returned structure is a list of lists:
+        [[pid, stat, statm, io], ...]
+        '''
+        if pids is None:
+            pids = [name for name in os.listdir(self.proc) if name.isdigit()]
+        processes = []
+        for pid in pids:
+            path = '%s/%s/' % (self.proc, pid)
+            stat = _readproc(path + 'stat')
+            if stat is None:
+                continue
+            statm = 'statm' in files and _readproc(path + 'statm') or None
+            io = 'io' in files and _readproc(path + 'io') or None
+            processes.append([pid, stat, statm, io])
+        return processes
+
+    def parse_uptime(self, data=None):
         '''
         Parse output from get_uptime().
         Returned structure is a tuple:
         (days, hours, minutes, seconds, seconds since boot)
         '''
-        return utils.parser_uptime(self.get_uptime())
+        if data is None:
+            data = self.get_uptime()
+        return utils.parser_uptime(data)
 
-    def parse_memory(self, mem_fields=('MemTotal', 'MemFree')):
+    def parse_memory(self, mem_fields=('MemTotal', 'MemFree'), data=None):
         '''
         Parse memory info from output of get_memory().
         Returned key, value pairs depend on keywords defined in mem_fields,
         which MUST be a tuple:
         self.parse_memory(('MemTotal',))
-        Search is case sensitive.
+        Search is case sensitive and keys must match exactly.
+        With mem_fields=None all keys are returned.
+
+        Returned values are integers in bytes, counts (HugePages_Total, ...)
+        are returned as they are.
 
         Returned structure is a dictionary:
         {key: value, ...}
         '''
-        return utils.parser_memory(self.get_memory(), mem_fields)
+        if data is None:
+            data = self.get_memory(mem_fields)
+        return utils.parser_memory(data, mem_fields)
 
-    def parse_swap(self):
+    def parse_memory_usage(self, data=None):
+        '''
+        Memory usage as reported by free(1), see utils.parser_memory_usage().
+        Returned structure is a dictionary, all values are in bytes:
+        {'total': value,
+        'used': value,
+        'free': value,
+        'shared': value,
+        'buffers': value,
+        'cache': value,
+        'available': value,
+        'swaptotal': value,
+        'swapused': value,
+        'swapfree': value}
+        '''
+        if data is None:
+            data = self.get_memory()
+        return utils.parser_memory_usage(utils.parser_memory(data))
+
+    def parse_swap(self, typed=False, include=(), exclude=(), data=None):
         '''
         Parse output of get_swap().
         Returned structure is a dictionary of dictionaries:
@@ -81,19 +251,246 @@ class Linux(object):
             'used', value,
             'priority', value}
         }
+
+        include, exclude - device patterns, see utils.matcher()
         '''
+        if data is None:
+            data = self.get_swap()
         fields = ('type', 'size', 'used', 'priority')
-        return utils.parser_swap(self.get_swap(), fields)
+        return utils.parser_swap(data, fields, typed, utils.matcher(include, exclude))
 
-    def parse_loadavg(self):
+    def parse_loadavg(self, typed=False, data=None):
         '''
         Parse output of get_loadavg().
         Returned structure is a tuple:
         (1min, 5min, 15min)
         '''
-        return utils.parser_loadavg(self.get_loadavg())
+        if data is None:
+            data = self.get_loadavg()
+        return utils.parser_loadavg(data, typed)
+
+    def parse_cpustat(self, typed=False, include=(), exclude=(), data=None):
+        '''
+        Parse output of get_cpustat().
+        Returned structure is a dictionary of dictionaries:
+        {cpu:
+            {'user': value,
+            'nice': value,
+            'system': value,
+            'idle': value,
+            'iowait': value,
+            'irq': value,
+            'softirq': value,
+            'steal': value}
+        }
+
+        cpu - 'cpu' for all CPUs together, 'cpu0', 'cpu1', ... for each
+        Values are percents of the CPU's time since the previous call,
+        since boot on the first call. Guest time is part of user time.
+
+        Counters of all CPUs are kept in one array, a NumPy array when
+        NumPy is installed, and percents of all CPUs are computed at once.
+
+        include, exclude - CPU name patterns, see utils.matcher()
+        '''
+        if data is None:
+            data = self.get_cpustat()
+        width = len(CPU_FIELDS)
+        names, counters, columns = utils.parser_cpustat(data, width)
+        previous = self.cputicks
+        if previous is not None and previous[0] != names:
+            # CPUs went on or offline.
+            previous = None
+        if numpy is not None:
+            ticks = numpy.fromstring(' '.join(counters), dtype=numpy.int64, sep=' ')
+            ticks = ticks.reshape(len(names), columns)[:, :width]
+            delta = ticks
+            if previous is not None:
+                # iowait may go backwards.
+                delta = numpy.maximum(ticks - previous[1], 0)
+            total = delta.sum(1)
+            total[total == 0] = 1
+            percents = (delta * 100.0 / total[:, numpy.newaxis]).ravel().tolist()
+        else:
+            ticks = array.array('L', map(int, counters))
+            if previous is None:
+                delta = ticks.tolist()
+            else:
+                delta = map(operator.sub, ticks, previous[1])
+            percents = []
+            for i in xrange(0, len(delta), columns):
+                row = [max(d, 0) for d in delta[i:i + width]]
+                total = float(sum(row)) or 1.0
+                percents.extend([d * 100 / total for d in row])
+        self.cputicks = (names, ticks)
+        match = utils.matcher(include, exclude)
+        cpu = records.maker(CPU_FIELDS, typed, 'Cpu', None)
+        parsed = {}
+        for i, name in enumerate(names):
+            if match and not match(name):
+                continue
+            row = percents[i * width:(i + 1) * width]
+            if typed:
+                parsed[name] = cpu([round(p, 2) for p in row])
+            else:
+                parsed[name] = cpu(['%.2f' % p for p in row])
+        return parsed
+
+    def parse_pressure(self, typed=False, data=None):
+        '''
+        Parse output of get_pressure().
+        Returned structure is a dictionary of dictionaries of dictionaries:
+        {resource:
+            {'some':
+                {'avg10': value,
+                'avg60': value,
+                'avg300': value,
+                'total': value},
+            'full':
+                {...}
+            }
+        }
+
+        resource - cpu, memory, io
+        some - share of time some tasks were stalled on resource, in percent
+            over the last 10, 60 and 300 seconds, total in microseconds
+        full - the same for all non-idle tasks stalled at once
+        '''
+        if data is None:
+            data = self.get_pressure()
+        return dict([(resource, utils.parser_nestedkeyed(d, typed)) for resource, d in data.items()])
 
-    def parse_ifstat(self):
+    def parse_cgroups(self, typed=False, files=None, include=(), exclude=(), data=None):
+        '''
+        Parse output of get_cgroups().
+        Returned structure is a dictionary of dictionaries:
+        {path:
+            {'cpu': {'usage_usec': value, 'user_usec': value, ...},
+            'memory': {'current': value, 'anon': value, 'file': value, ...},
+            'io': {device: {'rbytes': value, 'wbytes': value, ...}},
+            'pressure': {'cpu': {'some': {...}, 'full': {...}}, ...}}
+        }
+
+        Keys are the ones of cpu.stat, memory.stat and io.stat, devices of
+        io.stat are major:minor numbers. Parts come only from files in
+        files, cgroups.FILES by default, that the cgroup has, see
+        parse_pressure() for pressure.
+
+        include, exclude - cgroup path patterns, see utils.matcher()
+        '''
+        if data is None:
+            data = self.get_cgroups(files, utils.matcher(include, exclude))
+        else:
+            match = utils.matcher(include, exclude)
+            if match:
+                data = dict([(path, d) for path, d in data.items() if match(path)])
+        parsed = {}
+        for path, content in data.items():
+            group = parsed[path] = {}
+            if 'cpu.stat' in content:
+                group['cpu'] = utils.parser_flatkeyed(content['cpu.stat'], typed)
+            if 'memory.stat' in content or 'memory.current' in content:
+                memory = group['memory'] = utils.parser_flatkeyed(content.get('memory.stat', ''), typed)
+                if 'memory.current' in content:
+                    memory['current'] = content['memory.current'].strip()
+                    if typed:
+                        memory['current'] = int(memory['current'])
+            if 'io.stat' in content:
+                group['io'] = utils.parser_nestedkeyed(content['io.stat'], typed)
+            for resource in ('cpu', 'memory', 'io'):
+                name = resource + '.pressure'
+                if name in content:
+                    group.setdefault('pressure', {})[resource] = utils.parser_nestedkeyed(content[name], typed)
+        return parsed
+
+    def parse_processes(self, typed=False, top=None, key='cpu', include=(), exclude=(), data=None):
+        '''
+        Parse output of get_processes().
+        Returned structure is a dictionary of dictionaries:
+        {pid:
+            {'name': value,
+            'state': value,
+            'ppid': value,
+            'threads': value,
+            'cpu': value,
+            'utime': value,
+            'stime': value,
+            'vsize': value,
+            'rss': value,
+            'shared': value,
+            'text': value,
+            'data': value,
+            'read_bytes': value,
+            'write_bytes': value}
+        }
+
+        cpu - percent of one CPU used since the previous call, since the
+            process started for processes the previous call did not see
+        utime, stime - CPU seconds in user and system mode
+        vsize, rss, shared, text, data - bytes
+        read_bytes, write_bytes - bytes read and written to storage,
+            '-' (None if typed) when /proc/<pid>/io is not readable
+
+        top - only report the top processes by key, one of PROCESS_FIELDS.
+            When key comes from /proc/<pid>/stat, statm and io are only
+            read for these processes.
+        include, exclude - process name patterns, see utils.matcher()
+        '''
+        lazy = data is None and top is not None and (key == 'cpu' or key in _stat_fields)
+        if data is None:
+            data = self.get_processes(lazy and ('stat',) or ('stat', 'statm', 'io'))
+        match = utils.matcher(include, exclude)
+        now = self.get_uptime()
+        previous, since = self.cputimes, self.cputimes_at
+        cputimes = {}
+        index = PROCESS_FIELDS.index(key)
+        def rows():
+            for pid, stat, statm, io in data:
+                name, fields = utils.parser_pidstat(stat)
+                if match and not match(name):
+                    continue
+                utime, stime, start = int(fields[11]), int(fields[12]), int(fields[19])
+                cputimes[pid] = (start, utime + stime)
+                last = previous.get(pid)
+                if last is not None and last[0] == start and now > since:
+                    cpu = float(utime + stime - last[1]) / self.clktck / (now - since) * 100
+                else:
+                    elapsed = now - float(start) / self.clktck
+                    cpu = elapsed > 0 and float(utime + stime) / self.clktck / elapsed * 100 or 0.0
+                row = [name, fields[0], fields[1], fields[17], '%.2f' % cpu,
+                    '%.2f' % (float(utime) / self.clktck), '%.2f' % (float(stime) / self.clktck),
+                    fields[20], str(int(fields[21]) * self.pagesize)]
+                yield pid, self._process_files(row, statm, io)
+        if top is None:
+            selected = list(rows())
+        else:
+            # Only top rows are kept while scanning, no record is built for the rest.
+            selected = heapq.nlargest(top, rows(), key=lambda row: records.number(row[1][index]))
+        self.cputimes, self.cputimes_at = cputimes, now
+        if lazy and selected:
+            files = dict([(p[0], p) for p in self.get_processes(('statm', 'io'), [pid for pid, row in selected])])
+            for pid, row in selected:
+                if pid in files:
+                    self._process_files(row, files[pid][2], files[pid][3])
+        process = records.maker(PROCESS_FIELDS, typed, 'Process')
+        return dict([(pid, process(row)) for pid, row in selected])
+
+    def _process_files(self, row, statm, io):
+        '''Set the statm and io fields of a parse_processes() row.'''
+        row[9:] = ['-'] * 5
+        if statm is not None:
+            pages = statm.split()
+            row[9:12] = [str(int(pages[i]) * self.pagesize) for i in (2, 3, 5)]
+        if io is not None:
+            for line in io.splitlines():
+                name, value = line.split(': ', 1)
+                if name == 'read_bytes':
+                    row[12] = value.strip()
+                elif name == 'write_bytes':
+                    row[13] = value.strip()
+        return row
+
+    def parse_ifstat(self, typed=False, include=(), exclude=(), kinds=(), data=None):
         '''
         Parse output of get_ifstat().
         Returned structure is a dictionary of dictionaries:
@@ -110,8 +507,21 @@ class Linux(object):
                 'dropped': value},
             }
         }
+
+        Counters are the kernel's 64-bit counters as printed in /proc/net/dev.
+
+        include, exclude - interface patterns, see utils.matcher()
+        kinds - only report interfaces of these kinds, see get_kind(),
+            e.g. ('physical', 'bond')
+        Interfaces are filtered before their counters are parsed.
         '''
-        return utils.parser_ifstat(self.get_ifstat())
+        if data is None:
+            data = self.get_ifstat()
+        match = utils.matcher(include, exclude)
+        if kinds:
+            names = match
+            match = lambda name: (names is None or names(name)) and self.get_kind(name) in kinds
+        return utils.parser_netdev(data, typed, match)
 
 class FreeBSD(object):
     def __init__(self, libc='/lib/libc.so.7'):
@@ -121,6 +531,8 @@ class FreeBSD(object):
         self.ifstat = 'netstat -i -d -b -n -W'
         self.libc = libc
         self.pagesize = os.sysconf('SC_PAGE_SIZE')
+        # clock_gettime and the timespec type, loaded by the first get_uptime().
+        self.clock = None
 
     def get_uptime(self):
         '''
@@ -131,13 +543,16 @@ class FreeBSD(object):
         #define CLOCK_UPTIME_PRECISE    7       /* FreeBSD-specific. */
         #define CLOCK_UPTIME_FAST       8       /* FreeBSD-specific. */
         '''
-        from ctypes import Structure, cdll, byref, c_long
-        lib = cdll.LoadLibrary(self.libc)
-        class Data(Structure):
-            _fields_ = [('sec', c_long), ('nsec', c_long)]
-        struct = Data()
-        lib.clock_gettime(7, byref(struct))
-        return struct.sec
+        if self.clock is None:
+            from ctypes import Structure, cdll, byref, c_long
+            class Timespec(Structure):
+                _fields_ = [('sec', c_long), ('nsec', c_long)]
+            self.clock = (cdll.LoadLibrary(self.libc).clock_gettime, Timespec, byref)
+        clock_gettime, Timespec, byref = self.clock
+        # A timespec per call, threads calling get_uptime() at once do not share one.
+        ts = Timespec()
+        clock_gettime(7, byref(ts))
+        return ts.sec
 
     def get_memory(self):
         '''Get memory information.'''
@@ -151,36 +566,47 @@ class FreeBSD(object):
         '''Get load average.'''
         return utils.run(self.loadavg)
 
-    def get_ifstat(self):
-        '''Get interface statistics.'''
+    def get_ifstat(self, interfaces=None):
+        '''
+        Get interface statistics.
+        netstat reports a single interface by itself, more are all reported.
+        '''
+        if interfaces and len(interfaces) == 1:
+            return utils.run(self.ifstat.replace(' -i ', ' -I %s ' % interfaces[0]))
         return utils.run(self.ifstat)
 
-    def parse_uptime(self):
+    def parse_uptime(self, data=None):
         '''
         Parse output from get_uptime().
         Returned structure is tuple:
         (days, hours, minutes, seconds, seconds since boot)
         '''
-        return utils.parser_uptime(self.get_uptime())
+        if data is None:
+            data = self.get_uptime()
+        return utils.parser_uptime(data)
 
-    def parse_memory(self, mem_fields=('vm.stats.vm.v_page_count', 'vm.stats.vm.v_free_count', 'vm.stats.vm.v_inactive_count', 'vm.stats.vm.v_cache_count')):
+    def parse_memory(self, mem_fields=('vm.stats.vm.v_page_count', 'vm.stats.vm.v_free_count', 'vm.stats.vm.v_inactive_count', 'vm.stats.vm.v_cache_count'), data=None):
         '''
         Parse output from get_memory().
         Returned key, value pairs depend on keywords defined in mem_fields,
         which MUST be a tuple:
         self.parse_memory(('vm.stats.vm.v_page_count',))
-        Search is case sensitive.
+        Search is case sensitive and keys must match exactly.
+        With mem_fields=None all keys are returned.
 
-        By default, returned values are pages of memory.
+        Returned values are integers, page counts (keys ending with _count)
+        are converted to bytes.
 
         Returned structure is a dictionary.
         {key: value, ...}
 
         free = v_free_count + v_inactive_count + v_cache_count
         '''
-        return utils.parser_memory(self.get_memory(), mem_fields)
+        if data is None:
+            data = self.get_memory()
+        return utils.parser_memory(data, mem_fields, self.pagesize, ('_count',))
 
-    def parse_swap(self):
+    def parse_swap(self, typed=False, include=(), exclude=(), data=None):
         '''
         Parse output from get_swap().
         Returned structure is a dictionary of dictionaries:
@@ -190,19 +616,25 @@ class FreeBSD(object):
             'free', value,
             'percent', value}
         }
+
+        include, exclude - device patterns, see utils.matcher()
         '''
+        if data is None:
+            data = self.get_swap()
         fields = ('blocks', 'used', 'free', 'percent')
-        return utils.parser_swap(self.get_swap(), fields)
+        return utils.parser_swap(data, fields, typed, utils.matcher(include, exclude))
 
-    def parse_loadavg(self):
+    def parse_loadavg(self, typed=False, data=None):
         '''
         Parse output of get_loadavg().
         Returned structure is a tuple:
         (1min, 5min, 15min)
         '''
-        return utils.parser_loadavg(self.get_loadavg())
+        if data is None:
+            data = self.get_loadavg()
+        return utils.parser_loadavg(data, typed)
 
-    def parse_ifstat(self):
+    def parse_ifstat(self, typed=False, include=(), exclude=(), data=None):
         '''
         Parse output of get_ifstat().
         Returned structure is a dictionary of dictionaries of dictionaries of ...:
@@ -221,8 +653,13 @@ class FreeBSD(object):
                 }
             }
         }
+
+        include, exclude - interface patterns, see utils.matcher()
+        A single interface name in include is passed on to netstat.
         '''
-        return utils.parser_ifstat(self.get_ifstat())
+        if data is None:
+            data = self.get_ifstat(utils.literals(include))
+        return utils.parser_ifstat_freebsd(data, typed, utils.matcher(include, exclude))
 
 class SunOS(object):
     def __init__(self):
@@ -231,6 +668,7 @@ class SunOS(object):
         self.memory = 'kstat -p unix:0:system_pages'
         self.swap = 'swap -l'
         self.ifstat = 'dladm show-link -s'
+        self.ifstat_sampler = None
         self.pagesize = os.sysconf('SC_PAGE_SIZE')
 
     def get_uptime(self):
@@ -249,31 +687,61 @@ class SunOS(object):
         '''Get load average.'''
         return utils.run(self.loadavg)
 
-    def get_ifstat(self):
-        '''Get interface statistisc.'''
+    def get_ifstat(self, interfaces=None):
+        '''
+        Get interface statistisc.
+        With sample_ifstat() running, the latest report is returned without forking.
+        Raises the error of the sampler's command when it could not be run.
+        dladm reports a single interface by itself, more are all reported.
+        '''
+        if self.ifstat_sampler is not None:
+            report = self.ifstat_sampler.report()
+            # None until the first interval ends, dladm runs once meanwhile.
+            if report is not None:
+                return report
+        if interfaces and len(interfaces) == 1:
+            return utils.run('%s %s' % (self.ifstat, interfaces[0]))
         return utils.run(self.ifstat)
 
-    def parse_uptime(self):
+    def sample_ifstat(self, interval=5):
+        '''
+        Keep dladm running in interval mode, see sampler.Sampler.
+        Values become totals for the last interval seconds.
+        '''
+        cmd = '%s -i %d' % (self.ifstat, interval)
+        import sampler
+        self.ifstat_sampler = sampler.Sampler(cmd, self.parse_ifstat).start()
+        return self.ifstat_sampler
+
+    def parse_uptime(self, data=None):
         '''Parse output of get_uptime().'''
+        if data is None:
+            data = self.get_uptime()
         from time import time
-        return utils.parser_uptime(int(time()) - int(self.get_uptime().split()[-1]))
+        return utils.parser_uptime(int(time()) - int(utils.text(data).split()[-1]))
 
-    def parse_memory(self, mem_fields = ('unix:0:system_pages:physmem', 'unix:0:system_pages:freemem')):
+    def parse_memory(self, mem_fields = ('unix:0:system_pages:physmem', 'unix:0:system_pages:freemem'), data=None):
         '''
         Parse output from get_memory().
         Returned key, value pairs depend on keywords defined in mem_fields,
         whish MUST be a tuple:
         self.parse_memory(('unix:0:system_pages:physmem',))
-        Search is case sensitive.
+        Search is case sensitive and keys must match exactly.
+        With mem_fields=None all keys are returned.
 
-        By default, returned values are pages of memory.
+        Returned values are integers, page counts (physmem, freemem, ...)
+        are converted to bytes.
 
         Returned structure is a dictionary:
         {key: value, ...}
         '''
-        return utils.parser_memory(self.get_memory(), mem_fields)
+        paged = (':physmem', ':freemem', ':availrmem', ':lotsfree', ':desfree', ':minfree',
+            ':pagesfree', ':pagestotal', ':pageslocked', ':pp_kernel')
+        if data is None:
+            data = self.get_memory()
+        return utils.parser_memory(data, mem_fields, self.pagesize, paged)
 
-    def parse_swap(self):
+    def parse_swap(self, typed=False, include=(), exclude=(), data=None):
         '''
         Parse output of get_swap().
         Returned structure is a dictionary of dictionaries:
@@ -289,12 +757,16 @@ class SunOS(object):
         swaplo - The swaplow value for the area in 512-byte blocks.
         blocks - The swaplen value for the area in 512-byte blocks.
         free - The number of 512-byte blocks in this area that are not currently allocated.
+
+        include, exclude - swap file patterns, see utils.matcher()
         '''
+        if data is None:
+            data = self.get_swap()
         fields = ('dev', 'swaplo', 'blocks', 'free')
-        return utils.parser_storage(self.get_swap(), fields)
+        return utils.parser_swap(data, fields, typed, utils.matcher(include, exclude))
 
 
-    def parse_loadavg(self):
+    def parse_loadavg(self, typed=False, data=None):
         '''
         Parse output of get_loadavg().
         Returned structure is a tuple:
@@ -309,16 +781,21 @@ class SunOS(object):
         #define FSHIFT  8               /* bits to right of fixed binary point */
         #define FSCALE  (1<<FSHIFT)
         '''
-        data = self.get_loadavg()
-        data = data.split('\n')[:-1]
+        if data is None:
+            data = self.get_loadavg()
+        data = utils.text(data).split('\n')[:-1]
         rvalue = []
         for item in data:
-            rvalue.append('%.2f' % (float(item.split()[-1]) / float(256)))
+            value = float(item.split()[-1]) / float(256)
+            if typed:
+                rvalue.append(round(value, 2))
+            else:
+                rvalue.append('%.2f' % value)
         return tuple(rvalue)
 
-    def parse_ifstat(self):
+    def parse_ifstat(self, typed=False, include=(), exclude=(), data=None):
         '''
-        Parse output of get_ifstat().
+        Parse output of get_ifstat(), or data if given.
         Returned structure is a dictionary of dictionaries:
         {device:
             {'in':
@@ -331,8 +808,18 @@ class SunOS(object):
                 'errors': value}
             }
         }
-        '''
-        return utils.parser_ifstat(self.get_ifstat())
+
+        include, exclude - interface patterns, see utils.matcher()
+        A single interface name in include is passed on to dladm.
+        '''
+        match = utils.matcher(include, exclude)
+        if data is None:
+            if self.ifstat_sampler is not None and not typed and match is None:
+                sample = self.ifstat_sampler.parsed()
+                if sample is not None:
+                    return sample
+            data = self.get_ifstat(utils.literals(include))
+        return utils.parser_ifstat_sunos(data, typed, match)
 
 if __name__ == '__main__':
     print "not yet"
@@ -0,0 +1,138 @@
+'''
+Linux mount table, read again only when the kernel reports a change.
+
+/proc/self/mountinfo polls POLLPRI | POLLERR after a filesystem was
+mounted or unmounted in the process's mount namespace. MountTable keeps
+the file open and checks for that event with a zero timeout poll(2),
+so asking for the mounts of an unchanged table reads nothing.
+'''
+import threading
+import select
+import os
+import utils
+
+_tables = {}
+_lock = threading.Lock()
+
+def table(path='/proc/self/mountinfo'):
+    '''MountTable of path shared by all callers in the process.'''
+    with _lock:
+        if path not in _tables:
+            _tables[path] = MountTable(path)
+        return _tables[path]
+
+class MountTable(object):
+    '''
+    Mounts of /proc/self/mountinfo as (device, mount, fstype) tuples.
+
+    With start(), a thread waits for changes and subscribers hear about
+    them as they happen. Without it, changes are noticed by the next
+    mounts() call. Either way subscribers are called as
+    callback(added, removed)
+    with lists of (device, mount, fstype) tuples.
+    '''
+    def __init__(self, path='/proc/self/mountinfo'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'r', 0)
+        self.poll = select.poll()
+        self.poll.register(self.file.fileno(), select.POLLPRI | select.POLLERR)
+        self.table = []
+        # Number of times the table was read, 1 after __init__.
+        self.generation = 0
+        # {device: [mount, ...]} of the current generation, see devices().
+        self.devmap = (None, {})
+        self.callbacks = []
+        self.stopped = threading.Event()
+        self.thread = None
+        self.refresh(True)
+
+    def changed(self, timeout=0):
+        '''Wait up to timeout seconds for a change, tell whether one happened.'''
+        try:
+            return bool(self.poll.poll(timeout * 1000))
+        except select.error:
+            # Interrupted by a signal.
+            return False
+
+    def refresh(self, force=False):
+        '''Read the table again if it changed, or if force is set.'''
+        if not force and not self.changed():
+            return False
+        with self.lock:
+            self.file.seek(0)
+            table = utils.parser_mountinfo(self.file.read())
+            old = self.table
+            self.table = table
+            self.generation += 1
+        if old != table and self.generation > 1:
+            before, after = set(old), set(table)
+            added = [m for m in table if m not in before]
+            removed = [m for m in old if m not in after]
+            for callback in self.callbacks:
+                try:
+                    callback(added, removed)
+                except Exception:
+                    pass
+        return True
+
+    def mounts(self, fstypes=(), exclude_fstypes=(), match=None):
+        '''
+        Current mounts, filtered as utils.parser_mountinfo() does.
+        Returned structure is a list of tuples:
+        [(device, mount, fstype), ...]
+        '''
+        self.refresh()
+        table = self.table
+        if not fstypes and not exclude_fstypes and match is None:
+            return list(table)
+        return [(d, m, t) for d, m, t in table
+            if (not fstypes or t in fstypes) and t not in exclude_fstypes
+                and (match is None or match(d, m))]
+
+    def devices(self):
+        '''
+        Mount points of block devices, keyed by kernel device name as
+        used in /proc/diskstats, device mapper devices by their mapped name.
+        Rebuilt only when the table changes.
+        Returned structure is a dictionary:
+        {device: [mount, ...]}
+        '''
+        self.refresh()
+        generation, devmap = self.devmap
+        if generation == self.generation:
+            return devmap
+        devmap = {}
+        for device, mount, fstype in self.table:
+            if not device.startswith('/dev/'):
+                continue
+            if device.startswith('/dev/mapper/'):
+                name = device[len('/dev/mapper/'):]
+            else:
+                name = os.path.basename(os.path.realpath(device))
+            devmap.setdefault(name, []).append(mount)
+        self.devmap = (self.generation, devmap)
+        return devmap
+
+    def subscribe(self, callback):
+        '''Call callback(added, removed) on every change.'''
+        self.callbacks.append(callback)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            # Wake up now and then, so stop() does not wait forever.
+            if self.changed(0.5):
+                self.refresh(True)
+
+    def start(self):
+        '''Watch for changes in a background thread.'''
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name='wusu-mounts')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,267 @@
+'''
+Collect from many collectors at once in a single thread, without blocking.
+
+Loop.submit() starts the command behind a get_* or parse_* method and
+returns a Request right away. Output of all commands in flight is read
+as it arrives through poll(2), every command has its own timeout and can
+be cancelled, which kills it. Methods that do not fork (/proc reads,
+statvfs(2) with its own timeout) run at submit(). Commands that closed
+their output are reaped by later steps, without waiting for them.
+
+    loop = nonblocking.Loop()
+    a = load.FreeBSD()
+    requests = [loop.submit(a, 'parse_swap'), loop.submit(a, 'parse_ifstat', typed=True)]
+    loop.wait(requests, timeout=5)
+    swap, ifstat = [r.result for r in requests]
+
+An application running its own select/poll loop adds fds() to it and
+calls step(0) when one of them is ready, or when next_deadline() passes.
+'''
+import select
+import signal
+import fcntl
+import time
+import os
+import utils
+
+# Seconds between checks of commands that closed their output but did not exit yet.
+REAP = 0.005
+
+class Cancelled(Exception):
+    '''Request was cancelled before it finished.'''
+
+class Request(object):
+    '''
+    One get_* or parse_* call in flight.
+    When done is set, result holds what the method returned, or error the
+    exception it raised: utils.CommandError when the command failed or
+    timed out, Cancelled after cancel().
+    '''
+    def __init__(self, loop, collector, name, args, kwargs, timeout):
+        self.loop = loop
+        self.collector = collector
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        self.cmd = None
+        self.process = None
+        self.fd = None
+        self.chunks = []
+        self.deadline = time.time() + timeout
+        self.done = False
+        self.result = None
+        self.error = None
+        self.callbacks = []
+
+    def fileno(self):
+        return self.fd
+
+    def add_callback(self, callback):
+        '''Call callback(request) when done, right away if it is.'''
+        if self.done:
+            callback(self)
+        else:
+            self.callbacks.append(callback)
+
+    def cancel(self):
+        '''Kill the command, the request fails with Cancelled.'''
+        if not self.done:
+            self.loop._finish(self, error=Cancelled(self.cmd))
+
+class Loop(object):
+    '''
+    Commands in flight and the poll(2) object watching their output.
+    Commands are run as utils.run() runs them, see utils.popen().
+    '''
+    def __init__(self, timeout=None):
+        '''timeout - seconds a command may run, utils.TIMEOUT by default'''
+        self.timeout = timeout or utils.TIMEOUT
+        self.poll = select.poll()
+        # fd: request
+        self.requests = {}
+        # Requests whose command closed its output but did not exit yet.
+        self.closing = []
+        # Finished commands that did not exit yet.
+        self.exiting = []
+
+    def command(self, collector, name):
+        '''
+        Command run by collector's get_* method behind name, None if it
+        does not fork. Commands are kept in attributes named after the
+        metric (collector.swap = 'pstat -s').
+        '''
+        metric = name.split('_', 1)[1]
+        if getattr(collector, metric + '_sampler', None) is not None:
+            # A sampler already holds the latest report.
+            return None
+        cmd = getattr(collector, metric, None)
+        if isinstance(cmd, basestring) and not cmd.startswith('/'):
+            return cmd
+        return None
+
+    def submit(self, collector, name, *args, **kwargs):
+        '''
+        Start collector.name(*args, **kwargs), e.g.
+        loop.submit(storage.SunOS(), 'parse_iostat', include=('sd*',))
+        Returned structure is a Request.
+        '''
+        timeout = kwargs.pop('timeout', self.timeout)
+        request = Request(self, collector, name, args, kwargs, timeout)
+        # Arguments of get_* narrow the command (get_iostat(['da0'])), those
+        # calls run as they are. parse_* arguments apply to the output.
+        if not (name.startswith('get_') and (args or kwargs)):
+            request.cmd = self.command(collector, name)
+        if request.cmd is None:
+            try:
+                self._finish(request, getattr(collector, name)(*args, **kwargs))
+            except Exception, e:
+                self._finish(request, error=e)
+            return request
+        try:
+            request.process = utils.popen(request.cmd)
+        except OSError, e:
+            self._finish(request, error=e)
+            return request
+        request.fd = request.process.stdout.fileno()
+        flags = fcntl.fcntl(request.fd, fcntl.F_GETFL)
+        fcntl.fcntl(request.fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+        self.requests[request.fd] = request
+        self.poll.register(request.fd, select.POLLIN | select.POLLHUP | select.POLLERR)
+        return request
+
+    def _finish(self, request, result=None, error=None):
+        if request.fd is not None:
+            self.poll.unregister(request.fd)
+            del self.requests[request.fd]
+            request.fd = None
+        if request in self.closing:
+            self.closing.remove(request)
+        p = request.process
+        if p is not None:
+            if error is not None and p.poll() is None:
+                os.kill(p.pid, signal.SIGKILL)
+            p.stdout.close()
+            if p.poll() is None:
+                self.exiting.append(p)
+        request.process = None
+        request.chunks = []
+        request.result = result
+        request.error = error
+        request.done = True
+        for callback in request.callbacks:
+            try:
+                callback(request)
+            except Exception:
+                pass
+        request.callbacks = []
+
+    def _closed(self, request):
+        '''Output of request's command is closed, wait for it to exit.'''
+        self.poll.unregister(request.fd)
+        del self.requests[request.fd]
+        request.fd = None
+        if request.process.poll() is None:
+            self.closing.append(request)
+        else:
+            self._complete(request)
+
+    def _complete(self, request):
+        '''Request's command exited, call the method on its output.'''
+        p = request.process
+        output = ''.join(request.chunks)
+        if p.returncode != 0:
+            self._finish(request, error=utils.CommandError(request.cmd, p.returncode))
+            return
+        name = request.name
+        try:
+            if name.startswith('parse_'):
+                kwargs = dict(request.kwargs)
+                kwargs['data'] = output
+                result = getattr(request.collector, name)(*request.args, **kwargs)
+            else:
+                result = output
+        except Exception, e:
+            self._finish(request, error=e)
+            return
+        self._finish(request, result)
+
+    def step(self, timeout=None):
+        '''
+        Read output that is ready, waiting up to timeout seconds for some,
+        and finish commands that are done or out of time.
+        Returned structure is a list of requests finished in this step.
+        '''
+        finished = []
+        if self.requests or self.closing:
+            wait = self.next_deadline() - time.time()
+            if timeout is not None:
+                wait = min(wait, timeout)
+            try:
+                events = self.poll.poll(max(wait, 0) * 1000)
+            except select.error:
+                # Interrupted by a signal.
+                events = []
+            for fd, event in events:
+                request = self.requests.get(fd)
+                if request is None:
+                    continue
+                try:
+                    chunk = os.read(fd, 65536)
+                except OSError:
+                    continue
+                if chunk:
+                    request.chunks.append(chunk)
+                    continue
+                self._closed(request)
+                if request.done:
+                    finished.append(request)
+        closing, self.closing = self.closing, []
+        for request in closing:
+            # Popen.poll() reaps with waitpid(2) and WNOHANG.
+            if request.process.poll() is None:
+                self.closing.append(request)
+            else:
+                self._complete(request)
+                finished.append(request)
+        now = time.time()
+        for request in self.requests.values() + self.closing:
+            if request.deadline <= now:
+                self._finish(request, error=utils.CommandError(request.cmd, None))
+                finished.append(request)
+        # Reap commands that exited since.
+        self.exiting = [p for p in self.exiting if p.poll() is None]
+        return finished
+
+    def wait(self, requests=None, timeout=None):
+        '''
+        Run steps until requests, all of them by default, are done or
+        timeout seconds passed. Returned structure is a list of requests.
+        '''
+        if requests is None:
+            requests = self.requests.values() + self.closing
+        end = timeout is not None and time.time() + timeout or None
+        while [r for r in requests if not r.done]:
+            left = None
+            if end is not None:
+                left = end - time.time()
+                if left <= 0:
+                    break
+            self.step(left)
+        return requests
+
+    def fds(self):
+        '''File descriptors of commands in flight.'''
+        return self.requests.keys()
+
+    def next_deadline(self):
+        '''
+        Time the first command in flight runs out of time, None if none is,
+        or REAP seconds from now while a command that closed its output
+        did not exit yet.
+        '''
+        deadlines = [r.deadline for r in self.requests.values()]
+        if self.closing:
+            deadlines.append(time.time() + REAP)
+        if not deadlines:
+            return None
+        return min(deadlines)
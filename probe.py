@@ -0,0 +1,108 @@
+import threading
+import Queue
+import time
+import os
+
+class Prober(object):
+    '''
+    Call func(key) for many keys on a bounded pool of worker threads,
+    giving up on every key that does not answer within timeout seconds.
+
+    A call that blocks forever (statvfs(2) on a stale NFS or FUSE mount)
+    can not be interrupted, so its worker is abandoned and replaced.
+    Such keys are reported as unresponsive and skipped until backoff
+    seconds have passed and their hung call has returned.
+    '''
+    def __init__(self, func=os.statvfs, workers=8, timeout=2.0, backoff=60.0, budget=None):
+        '''
+        budget - seconds one probe() may take in total, defaults to 2 * timeout.
+        Keys still waiting for a free worker when it runs out are left out.
+        '''
+        self.func = func
+        self.workers = workers
+        self.timeout = timeout
+        self.backoff = backoff
+        self.budget = budget or 2 * timeout
+        # Never run more than this many threads, hung ones included.
+        self.max_threads = workers * 4
+        self.threads = 0
+        self.lock = threading.Lock()
+        self.jobs = Queue.Queue()
+        self.results = Queue.Queue()
+        # key: time a worker started calling func(key)
+        self.started = {}
+        # key: time after which key is probed again
+        self.unresponsive = {}
+        # keys whose call timed out and did not return yet
+        self.hung = set()
+        # keys waiting in jobs for a free worker
+        self.queued = set()
+
+    def _worker(self):
+        while True:
+            key = self.jobs.get()
+            with self.lock:
+                self.queued.discard(key)
+                self.started[key] = time.time()
+            try:
+                result, error = self.func(key), None
+            except Exception, e:
+                result, error = None, e
+            with self.lock:
+                self.started.pop(key, None)
+                self.hung.discard(key)
+            self.results.put((key, result, error))
+
+    def _spawn(self):
+        '''Keep workers threads available, not counting hung ones.'''
+        with self.lock:
+            while self.threads - len(self.hung) < self.workers and self.threads < self.max_threads:
+                t = threading.Thread(target=self._worker, name='wusu-probe')
+                t.daemon = True
+                t.start()
+                self.threads += 1
+
+    def probe(self, keys):
+        '''
+        Call func for every key, skipping unresponsive ones.
+        Keys that raised an exception are left out.
+        Returned structure is a dictionary:
+        {key: result, ...}
+        '''
+        now = time.time()
+        deadline = now + self.budget
+        wanted = set()
+        # Workers discard hung keys as their calls return.
+        with self.lock:
+            for key in keys:
+                if key in self.hung or self.unresponsive.get(key, 0) > now:
+                    continue
+                self.unresponsive.pop(key, None)
+                wanted.add(key)
+        self._spawn()
+        with self.lock:
+            for key in wanted - self.queued - set(self.started):
+                self.queued.add(key)
+                self.jobs.put(key)
+        parsed = {}
+        while wanted and time.time() < deadline:
+            try:
+                key, result, error = self.results.get(timeout=min(self.timeout, 0.05))
+            except Queue.Empty:
+                pass
+            else:
+                # Late answers from mounts that hung during an earlier probe are dropped.
+                if key in wanted:
+                    wanted.discard(key)
+                    if error is None:
+                        parsed[key] = result
+            now = time.time()
+            with self.lock:
+                expired = [k for k in wanted if now - self.started.get(k, now) > self.timeout]
+                for key in expired:
+                    wanted.discard(key)
+                    self.hung.add(key)
+                    self.unresponsive[key] = now + self.backoff
+            if expired:
+                self._spawn()
+        return parsed
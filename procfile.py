@@ -0,0 +1,128 @@
+'''
+/proc files kept open and read again into a reusable buffer.
+
+Reading a /proc file the usual way opens, reads and closes it every time
+and allocates a new string for the whole file. ProcFile opens it once and
+reads it from offset 0 into the same bytearray on every call, with
+os.preadv() where available, lseek() and readinto() otherwise, until a
+read returns nothing. Callers needing a few values of a file take only
+their bytes out of the buffer, see words() and lines().
+'''
+import threading
+import io
+import os
+import re
+
+_word = re.compile(r'\S+')
+_files = {}
+_lock = threading.Lock()
+
+def get(path):
+    '''ProcFile of path shared by all callers in the process.'''
+    with _lock:
+        if path not in _files:
+            _files[path] = ProcFile(path)
+        return _files[path]
+
+class ProcFile(object):
+    '''
+    A /proc file read again from the start on every call. /proc files
+    are generated when read, so reading from offset 0 gives current values.
+    '''
+    def __init__(self, path, size=4096):
+        self.path = path
+        self.file = io.FileIO(path, 'r')
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.lock = threading.Lock()
+        # Bytes read by the last fill().
+        self.size = 0
+
+    def fill(self):
+        '''
+        Read the file into buffer, growing it until the whole file fits,
+        and return its size. Callers must hold lock.
+        seq_file files (/proc/net/dev, /proc/swaps) return about a page per
+        read(2), so reads go on until one returns nothing.
+        '''
+        fd = self.file.fileno()
+        size = 0
+        if not hasattr(os, 'preadv'):
+            os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            if size == len(self.buffer):
+                buffer = bytearray(len(self.buffer) * 2)
+                buffer[:size] = self.buffer
+                self.buffer = buffer
+                self.view = memoryview(self.buffer)
+            if hasattr(os, 'preadv'):
+                count = os.preadv(fd, [self.view[size:]], size)
+            else:
+                count = self.file.readinto(self.view[size:])
+            if not count:
+                self.size = size
+                return size
+            size += count
+
+    def read(self):
+        '''The whole file, as a string.'''
+        with self.lock:
+            size = self.fill()
+            return self.view[:size].tobytes()
+
+    def words(self, count):
+        '''
+        First count whitespace separated words of the file, the rest of it
+        is not copied out of the buffer.
+        '''
+        with self.lock:
+            size = self.fill()
+            words = []
+            for word in _word.finditer(self.buffer, 0, size):
+                words.append(self.view[word.start():word.end()].tobytes())
+                if len(words) == count:
+                    break
+            return words
+
+    def lines(self, keys):
+        '''
+        Lines starting with one of keys followed by ':' (/proc/meminfo,
+        /proc/<pid>/status), joined as a string. Other lines are not
+        copied out of the buffer.
+        '''
+        with self.lock:
+            size = self.fill()
+            buf = self.buffer
+            lines = []
+            for key in keys:
+                key += ':'
+                if buf.startswith(key, 0, size):
+                    start = 0
+                else:
+                    start = buf.find('\n' + key, 0, size)
+                    if start < 0:
+                        continue
+                    start += 1
+                end = buf.find('\n', start, size)
+                if end < 0:
+                    end = size
+                lines.append(self.view[start:end].tobytes())
+            return '\n'.join(lines)
+
+    def head(self, key):
+        '''
+        Lines before the first line starting with key (the cpu lines of
+        /proc/stat before 'intr'), as a string. The rest of the file is
+        not copied out of the buffer.
+        '''
+        with self.lock:
+            size = self.fill()
+            end = self.buffer.find('\n' + key, 0, size)
+            if end < 0:
+                end = size
+            else:
+                end += 1
+            return self.view[:end].tobytes()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,86 @@
+import utils
+
+class Rates(object):
+    '''
+    Turn cumulative counters into per-second rates.
+
+    update() takes output of a parse_* method, e.g. load.*.parse_ifstat(),
+    nested dictionaries (or records) with counters as leaves, and returns
+    the same structure with every counter replaced by a dictionary:
+    {'counter': value, 'rate': value}
+
+    Rates are computed against the previous update() over monotonic time.
+    rate is None for counters seen for the first time, and when a counter
+    went backwards and that can not be explained by a wrap at its width:
+    the device was re-created, the driver reset it, or the host rebooted.
+    Counters are 64-bit by default, where going backwards always is a reset.
+    Counters of devices that disappear are forgotten.
+    '''
+    def __init__(self, source=None, width=64):
+        '''
+        source - function returning samples, used when update() gets none
+        width - bits of the counters, 32 or 64, or a function returning them
+            for the path of a counter, e.g. ('eth0', 'in', 'bytes')
+        '''
+        self.source = source
+        self.width = width
+        # path: counter
+        self.previous = {}
+        self.time = None
+        self.wraps = 0
+        self.resets = 0
+
+    def delta(self, old, new, width=64):
+        '''Increase of a width bits counter from old to new, or None if it was reset.'''
+        if new >= old:
+            return new - old
+        # A counter that wrapped ends up below a small increase past 2**width.
+        if old < 2 ** width:
+            wrapped = new + 2 ** width - old
+            if wrapped < 2 ** (width - 1):
+                self.wraps += 1
+                return wrapped
+        self.resets += 1
+        return None
+
+    def _walk(self, sample, path, interval, counters):
+        if hasattr(sample, 'items'):
+            parsed = {}
+            for key, value in sample.items():
+                parsed[key] = self._walk(value, path + (key,), interval, counters)
+            return parsed
+        # Not a counter: mount point, address, a value that already is a rate.
+        if isinstance(sample, float):
+            return sample
+        try:
+            value = int(sample)
+        except (TypeError, ValueError):
+            return sample
+        counters[path] = value
+        rate = None
+        if interval and path in self.previous:
+            width = self.width
+            if callable(width):
+                width = width(path)
+            delta = self.delta(self.previous[path], value, width)
+            if delta is not None:
+                rate = delta / interval
+        return {'counter': value, 'rate': rate}
+
+    def update(self, sample=None, now=None):
+        '''
+        Return sample with rates, see Rates.
+        now is the monotonic time sample was taken at, see utils.monotonic().
+        '''
+        if sample is None:
+            sample = self.source()
+        if now is None:
+            now = utils.monotonic()
+        interval = None
+        if self.time is not None and now > self.time:
+            interval = float(now - self.time)
+        counters = {}
+        parsed = self._walk(sample, (), interval, counters)
+        self.previous = counters
+        self.time = now
+        return parsed
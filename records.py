@@ -0,0 +1,141 @@
+'''
+Compact typed records for parser results.
+
+A record stores its values in __slots__ and converts them to numbers once,
+when it is built. It also behaves like the dictionary the parsers return
+by default, so record['avgrq-sz'], record.keys() and dict(record.items())
+work as they do with dictionaries.
+'''
+import re
+
+_classes = {}
+
+def number(value):
+    '''
+    Convert a parsed string to int or float.
+    Percent signs are dropped, '-' (no value) becomes None,
+    anything else that is not a number is returned as it is.
+    '''
+    if not isinstance(value, basestring):
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    if value == '-':
+        return None
+    number = value.rstrip('%')
+    try:
+        return int(number)
+    except ValueError:
+        pass
+    try:
+        return float(number)
+    except ValueError:
+        return value
+
+class Record(object):
+    '''Base class of records returned by record().'''
+    __slots__ = ()
+    # Dictionary keys, in the same order as __slots__.
+    _keys = ()
+    _attrs = {}
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self._attrs[key])
+        except KeyError:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._attrs
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__,
+            ', '.join(['%s=%r' % (a, getattr(self, a)) for a in self.__slots__]))
+
+    def get(self, key, default=None):
+        if key in self._attrs:
+            return getattr(self, self._attrs[key])
+        return default
+
+    def keys(self):
+        return list(self._keys)
+
+    def values(self):
+        return [getattr(self, a) for a in self.__slots__]
+
+    def items(self):
+        return zip(self._keys, self.values())
+
+    def as_dict(self):
+        '''Dictionary view, nested records are converted too.'''
+        parsed = {}
+        for key, value in self.items():
+            if isinstance(value, Record):
+                value = value.as_dict()
+            parsed[key] = value
+        return parsed
+
+def record(fields, name='Record'):
+    '''
+    Return a Record class with one slot for every field.
+    Field names that are not identifiers ('avgrq-sz', 'in') get slots with
+    other characters replaced by '_' (avgrq_sz, in_).
+    Classes are cached, asking twice for the same fields returns the same class.
+    '''
+    fields = tuple(fields)
+    if (name, fields) not in _classes:
+        attrs = []
+        for field in fields:
+            attr = re.sub(r'\W', '_', field)
+            if attr in ('in', 'class', 'from', 'global', 'pass'):
+                attr += '_'
+            attrs.append(attr)
+        # A generated __init__ assigns slots directly, much faster than setattr() in a loop.
+        namespace = {}
+        exec 'def __init__(self, %s):\n    %s\n' % (', '.join(attrs),
+            '\n    '.join(['self.%s = %s' % (a, a) for a in attrs])) in namespace
+        _classes[(name, fields)] = type(name, (Record,), {
+            '__slots__': tuple(attrs),
+            '__init__': namespace['__init__'],
+            '_keys': fields,
+            '_attrs': dict(zip(fields, attrs))
+        })
+    return _classes[(name, fields)]
+
+def maker(fields, typed, name='Record', convert=number):
+    '''
+    Return a function building one parser row from a sequence of values:
+    a dictionary, or a record with values converted by convert if typed.
+    Parsers that know their values pass a cheaper convert (int),
+    or None when values need no conversion.
+    '''
+    if not typed:
+        return lambda values: dict(zip(fields, values))
+    cls = record(fields, name)
+    if convert is None:
+        return lambda values: cls(*values)
+    return lambda values: cls(*map(convert, values))
+
+def as_dict(parsed):
+    '''Dictionary view of parser results, records included.'''
+    if isinstance(parsed, Record):
+        return parsed.as_dict()
+    if isinstance(parsed, dict):
+        return dict([(k, as_dict(v)) for k, v in parsed.items()])
+    return parsed
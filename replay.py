@@ -0,0 +1,299 @@
+'''
+Record raw collector output and replay it through the parsers.
+
+record() calls every get_* method of a load.* or storage.* collector and
+keeps what they returned, along with the system and time:
+    fixture = replay.record(load.Linux(), 'linux-load.json')
+replay() builds a collector of the recorded class whose get_* methods
+return the recorded output, so its parse_* methods run on any system:
+    a = replay.replay(replay.load_fixture('freebsd-load.json'))
+    a.parse_ifstat()
+
+synthetic() makes fixtures of any size for every supported system, see
+bench.py for parser throughput measured on them.
+'''
+import inspect
+import json
+import time
+import os
+import load
+import storage
+
+_modules = {'load': load, 'storage': storage}
+
+def getters(collector):
+    '''Names of get_* methods of collector that take no arguments.'''
+    names = []
+    for name, method in inspect.getmembers(collector, inspect.ismethod):
+        if not name.startswith('get_'):
+            continue
+        args, varargs, keywords, defaults = inspect.getargspec(method)
+        if len(args) - len(defaults or ()) == 1:
+            names.append(name)
+    return sorted(names)
+
+def record(collector, path=None):
+    '''
+    Call every get_* method of collector, see getters().
+    Methods that raise are left out, their output is the exception in errors.
+    If path is given, the fixture is also written there as JSON.
+
+    Returned structure is a dictionary:
+    {'sysname': value,
+    'time': value,
+    'module': value,
+    'class': value,
+    'outputs': {method: output, ...},
+    'errors': {method: error, ...}}
+    '''
+    fixture = {
+        'sysname': os.uname()[0],
+        'time': time.time(),
+        'module': collector.__class__.__module__,
+        'class': collector.__class__.__name__,
+        'outputs': {},
+        'errors': {}
+    }
+    for name in getters(collector):
+        try:
+            fixture['outputs'][name] = getattr(collector, name)()
+        except Exception, e:
+            fixture['errors'][name] = '%s: %s' % (e.__class__.__name__, e)
+    if path is not None:
+        f = open(path, 'w')
+        json.dump(fixture, f, indent=1, sort_keys=True)
+        f.close()
+    return fixture
+
+def load_fixture(path):
+    '''Read a fixture written by record().'''
+    f = open(path, 'r')
+    fixture = json.load(f)
+    f.close()
+    return fixture
+
+def replay(fixture, *args, **kwargs):
+    '''
+    Return an instance of the fixture's collector class, built with args and
+    kwargs, whose get_* methods return the fixture's outputs instead of
+    reading the system. Methods without output raise KeyError.
+    The parsers are told the fixture's system, not the running one.
+    '''
+    cls = getattr(_modules[str(fixture['module'])], str(fixture['class']))
+    collector = cls(*args, **kwargs)
+    for name in getters(collector):
+        setattr(collector, name, _output(fixture['outputs'], name))
+    return collector
+
+def _output(outputs, name):
+    # Arguments (devices, interfaces to report) are ignored, the parsers filter.
+    def output(*args, **kwargs):
+        return outputs[name]
+    return output
+
+def _swaps(count):
+    lines = ['Filename\t\t\t\tType\t\tSize\tUsed\tPriority']
+    for i in range(count):
+        lines.append('/dev/swap%d                              partition\t4194300\t%d\t-%d' % (i, i * 4, i + 2))
+    return '\n'.join(lines) + '\n'
+
+def _netdev(count):
+    lines = ['Inter-|   Receive                                                |  Transmit',
+        ' face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed']
+    for i in range(count):
+        lines.append('veth%d: %d %d 0 %d 0 0 0 0 %d %d 0 0 0 0 0 0' % (i, i * 1000, i, i % 3, i * 2000, i * 2))
+    return '\n'.join(lines) + '\n'
+
+def _diskstats(count):
+    lines = []
+    # Devices without any I/O are left out by the parser, give all of them some.
+    for i in range(1, count + 1):
+        lines.append('%4d %7d dev%d %d 0 %d %d %d 0 %d %d 0 %d %d' % (
+            8, i, i, i * 10, i * 80, i * 3, i * 20, i * 160, i * 5, i * 7, i * 8))
+    return '\n'.join(lines) + '\n'
+
+def _cpustat(count):
+    lines = []
+    for i in range(-1, count):
+        name = i < 0 and 'cpu' or 'cpu%d' % i
+        scale = i < 0 and count or 1
+        lines.append('%s %d %d %d %d %d %d %d %d 0 0' % (name, scale * (1000 + i), scale * 10, scale * (500 + i),
+            scale * 8000, scale * (i % 7), scale * 3, scale * 20, scale * (i % 5)))
+    return '\n'.join(lines) + '\n'
+
+def _pressure(count):
+    return dict([(resource, 'some avg10=%d.00 avg60=0.50 avg300=0.25 total=%d\n'
+        'full avg10=0.00 avg60=0.00 avg300=0.00 total=%d\n' % (i, i * 1000, i * 100))
+        for i, resource in enumerate(('cpu', 'memory', 'io'))])
+
+def _cgroups(count):
+    groups = {}
+    pressure = _pressure(count)
+    for i in range(count):
+        path = i and '/system.slice/c%d.scope' % i or '/'
+        groups[path] = {
+            'cpu.stat': 'usage_usec %d\nuser_usec %d\nsystem_usec %d\nnr_periods 0\nnr_throttled 0\n'
+                'throttled_usec 0\n' % (i * 3000, i * 2000, i * 1000),
+            'memory.current': '%d\n' % (i * 1048576),
+            'memory.stat': 'anon %d\nfile %d\nkernel_stack %d\nsock 0\nshmem 0\n' % (i * 524288, i * 262144, i * 16384),
+            'io.stat': '8:0 rbytes=%d wbytes=%d rios=%d wios=%d dbytes=0 dios=0\n' % (i * 4096, i * 8192, i, i * 2),
+            'cpu.pressure': pressure['cpu'],
+            'memory.pressure': pressure['memory'],
+            'io.pressure': pressure['io'],
+        }
+    return groups
+
+def _processes(count):
+    # [pid, stat, statm, io], every tenth process belongs to another user and has no io.
+    processes = []
+    for i in range(1, count + 1):
+        stat = '%d (proc %d) S 1 %d %d 0 -1 4194560 %d 0 0 0 %d %d 0 0 20 0 %d 0 %d %d %d 18446744073709551615\n' % (
+            i, i, i, i, i * 10, i * 7, i * 3, i % 8 + 1, i * 100, i * 1048576, i * 64)
+        statm = '%d %d %d %d 0 %d 0\n' % (i * 256, i * 64, i * 16, 8, i * 32)
+        io = None
+        if i % 10:
+            io = 'rchar: %d\nwchar: %d\nsyscr: %d\nsyscw: %d\nread_bytes: %d\nwrite_bytes: %d\n' \
+                'cancelled_write_bytes: 0\n' % (i * 4096, i * 2048, i, i, i * 512, i * 256)
+        processes.append([str(i), stat, statm, io])
+    return processes
+
+def _statvfs(count):
+    # (bsize, frsize, blocks, bfree, bavail, files, ffree, favail, flag, namemax)
+    return [('/dev/dev%d' % i, '/mnt/%d' % i, 'ext4',
+        (4096, 4096, 262144, 131072 + i, 120000 + i, 65536, 60000 - i, 60000 - i, 0, 255))
+        for i in range(count)]
+
+def _freebsd_netstat(count):
+    lines = ['Name    Mtu Network       Address              Ipkts Ierrs Idrop     Ibytes    Opkts Oerrs     Obytes  Coll Drop']
+    for i in range(count):
+        lines.append('em%d   1500 <Link#%d>     00:0c:29:00:%02x:%02x %d 0 - %d %d 0 %d 0 0' % (
+            i, i + 1, i / 256 % 256, i % 256, i * 10, i * 1000, i * 20, i * 2000))
+        lines.append('em%d      - 10.%d.%d.0/24 10.%d.%d.1 %d - - %d %d - %d - -' % (
+            i, i / 256 % 256, i % 256, i / 256 % 256, i % 256, i * 5, i * 500, i * 6, i * 600))
+    return '\n'.join(lines) + '\n'
+
+def _freebsd_iostat(count):
+    lines = ['                        extended device statistics  ',
+        'device     r/s   w/s    kr/s    kw/s qlen svc_t  %b  ']
+    for i in range(count):
+        lines.append('ada%d   %d.0 %d.0 %d.0 %d.0 %d %d.%d %d' % (i, i % 50, i % 30, i * 8, i * 4, i % 4, i % 9, i % 10, i % 100))
+    return '\n'.join(lines) + '\n'
+
+def _freebsd_df(count):
+    lines = ['Filesystem  1K-blocks     Used    Avail Capacity iused   ifree %iused  Mounted on']
+    for i in range(count):
+        lines.append('/dev/ada%dp2 %d %d %d %d%% %d %d %d%% /mnt/%d' % (
+            i, 1048576, i * 100, 1048576 - i * 100, i % 100, i * 10, 65536 - i, i % 100, i))
+    return '\n'.join(lines) + '\n'
+
+def _freebsd_pstat(count):
+    lines = ['Device          1K-blocks     Used    Avail Capacity']
+    for i in range(count):
+        lines.append('/dev/ada%dp3     4194304    %d  %d     %d%%' % (i, i * 4, 4194304 - i * 4, i % 100))
+    if count > 1:
+        lines.append('Total          %d    0  %d     0%%' % (4194304 * count, 4194304 * count))
+    return '\n'.join(lines) + '\n'
+
+def _sunos_dladm(count):
+    lines = ['LINK         IPACKETS  RBYTES  IERRORS  OPACKETS  OBYTES  OERRORS']
+    for i in range(count):
+        lines.append('net%d %d %d 0 %d %d 0' % (i, i * 10, i * 1000, i * 20, i * 2000))
+    return '\n'.join(lines) + '\n'
+
+def _sunos_iostat(count):
+    lines = ['                    extended device statistics              ',
+        '    r/s    w/s   kr/s   kw/s wait actv wsvc_t asvc_t  %w  %b device']
+    for i in range(count):
+        lines.append('    %d.0    %d.0   %d.0   %d.0  0.0  0.%d    0.0    %d.%d   0   %d c%dt0d0' % (
+            i % 50, i % 30, i * 8, i * 4, i % 10, i % 9, i % 10, i % 100, i))
+    return '\n'.join(lines) + '\n'
+
+def _sunos_df(count):
+    lines = ['Filesystem            kbytes    used   avail capacity  Mounted on']
+    for i in range(count):
+        lines.append('/dev/dsk/c%dt0d0s0 %d %d %d %d%% /mnt/%d' % (
+            i, 1048576, i * 100, 1048576 - i * 100, i % 100, i))
+    return '\n'.join(lines) + '\n'
+
+def _sunos_dfi(count):
+    lines = ['Filesystem             iused   ifree  %iused  Mounted on']
+    for i in range(count):
+        lines.append('/dev/dsk/c%dt0d0s0 %d %d %d%% /mnt/%d' % (i, i * 10, 65536 - i, i % 100, i))
+    return '\n'.join(lines) + '\n'
+
+def _sunos_swap(count):
+    lines = ['swapfile             dev    swaplo   blocks     free']
+    for i in range(count):
+        lines.append('/dev/zvol/dsk/rpool/swap%d 256,%d      16  2097136  %d' % (i, i, 2097136 - i))
+    return '\n'.join(lines) + '\n'
+
+# (module, class): {method: function of count returning the raw output}
+_generators = {
+    ('load', 'Linux'): {
+        'get_uptime': lambda count: 350735.47,
+        'get_memory': lambda count: 'MemTotal:       16318480 kB\nMemFree:         1150760 kB\n'
+            'MemAvailable:    9858296 kB\nBuffers:          632888 kB\nCached:          7734568 kB\n'
+            'Shmem:            681352 kB\nSReclaimable:     498716 kB\nSwapTotal:       8388604 kB\n'
+            'SwapFree:        8388604 kB\nHugePages_Total:       0\n',
+        'get_swap': _swaps,
+        'get_loadavg': lambda count: '0.20 0.18 0.12 1/80 11206\n',
+        'get_ifstat': _netdev,
+        'get_processes': _processes,
+        'get_cpustat': _cpustat,
+        'get_pressure': _pressure,
+        'get_cgroups': _cgroups,
+    },
+    ('load', 'FreeBSD'): {
+        'get_uptime': lambda count: 350735,
+        'get_memory': lambda count: 'vm.stats.vm.v_page_count: 2029342\nvm.stats.vm.v_free_count: 1434612\n'
+            'vm.stats.vm.v_inactive_count: 187443\nvm.stats.vm.v_cache_count: 0\n',
+        'get_swap': _freebsd_pstat,
+        'get_loadavg': lambda count: '{ 0.20 0.18 0.12 }\n',
+        'get_ifstat': _freebsd_netstat,
+    },
+    ('load', 'SunOS'): {
+        'get_uptime': lambda count: 'unix:0:system_misc:boot_time\t%d\n' % (time.time() - 350735),
+        'get_memory': lambda count: 'unix:0:system_pages:physmem\t1046491\nunix:0:system_pages:freemem\t612303\n',
+        'get_swap': _sunos_swap,
+        'get_loadavg': lambda count: 'unix:0:system_misc:avenrun_15min\t31\n'
+            'unix:0:system_misc:avenrun_1min\t51\nunix:0:system_misc:avenrun_5min\t46\n',
+        'get_ifstat': _sunos_dladm,
+    },
+    ('storage', 'Linux'): {
+        'get_statvfs': _statvfs,
+        'get_inodes': _statvfs,
+        'get_fsusage': _statvfs,
+        'get_iostat': _diskstats,
+        'get_uptime': lambda count: '350735.47 234388.90\n',
+    },
+    ('storage', 'FreeBSD'): {
+        'get_inodes': _freebsd_df,
+        'get_fsusage': _freebsd_df,
+        'get_iostat': _freebsd_iostat,
+    },
+    ('storage', 'SunOS'): {
+        'get_inodes': _sunos_dfi,
+        'get_fsusage': _sunos_df,
+        'get_iostat': _sunos_iostat,
+    },
+}
+
+def synthetic(module, sysname, count=10):
+    '''
+    Fixture with made up output of collector module.sysname, for example
+    synthetic('storage', 'SunOS', 10000). Tables (interfaces, devices,
+    mounts, swap areas) have count rows, other outputs do not scale.
+    '''
+    generators = _generators[(module, sysname)]
+    return {
+        'sysname': sysname,
+        'time': time.time(),
+        'module': module,
+        'class': sysname,
+        'outputs': dict([(name, f(count)) for name, f in generators.items()]),
+        'errors': {}
+    }
+
+def systems():
+    '''(module, sysname) pairs synthetic() has fixtures for.'''
+    return sorted(_generators.keys())
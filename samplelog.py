@@ -0,0 +1,214 @@
+'''
+Append-only binary sample log.
+
+File layout, all numbers little endian:
+    magic 'WUSULOG1'
+    uint32 header size, uint32 number of columns
+    column names separated by newlines, padded with zeros to 8 bytes
+    records: float64 timestamp, float64 value for every column
+
+Missing values are stored as NaN. A file holds one fixed set of columns,
+a log opened with different columns starts a new file.
+'''
+from array import array
+import struct
+import mmap
+import os
+import utils
+
+MAGIC = 'WUSULOG1'
+_head = struct.Struct('<8sII')
+_nan = float('nan')
+
+def _header(columns):
+    names = '\n'.join(columns)
+    size = _head.size + len(names)
+    size += -size % 8
+    return _head.pack(MAGIC, size, len(columns)) + names + '\0' * (size - _head.size - len(names))
+
+def _columns(path):
+    '''Columns of an existing log file, None if it is not one.'''
+    f = open(path, 'rb')
+    try:
+        head = f.read(_head.size)
+        if len(head) < _head.size:
+            return None
+        magic, size, count = _head.unpack(head)
+        if magic != MAGIC:
+            return None
+        names = f.read(size - _head.size).rstrip('\0')
+    finally:
+        f.close()
+    return tuple(names and names.split('\n') or ())
+
+def _cut(path, header):
+    '''True if path holds the beginning of header only, cut short by a crash.'''
+    f = open(path, 'rb')
+    try:
+        data = f.read(len(header))
+    finally:
+        f.close()
+    return len(data) < len(header) and header.startswith(data)
+
+def files(path):
+    '''Existing files of a rotated log, oldest first.'''
+    rotated = []
+    n = 1
+    while os.path.exists('%s.%d' % (path, n)):
+        rotated.insert(0, '%s.%d' % (path, n))
+        n += 1
+    if os.path.exists(path):
+        rotated.append(path)
+    return rotated
+
+class SampleLog(object):
+    '''
+    Write samples to path as fixed size records.
+    When the file grows past max_bytes it is renamed to path.1 (path.1 to
+    path.2, ...) and a new one is started; at most keep old files are kept.
+    '''
+    def __init__(self, path, columns, max_bytes=64 * 1024 * 1024, keep=5):
+        self.path = path
+        self.columns = tuple(columns)
+        self.index = dict([(c, i) for i, c in enumerate(self.columns)])
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.record = struct.Struct('<%dd' % (len(self.columns) + 1))
+        self.file = None
+        if os.path.exists(path) and _columns(path) != self.columns and not _cut(path, _header(self.columns)):
+            self.rotate()
+        self._open()
+
+    def _open(self):
+        header = _header(self.columns)
+        size = 0
+        if os.path.exists(self.path):
+            size = os.path.getsize(self.path)
+        # Drop a record cut short by a crash.
+        if size > len(header):
+            size -= (size - len(header)) % self.record.size
+            f = open(self.path, 'r+b')
+            f.truncate(size)
+            f.close()
+        elif size < len(header):
+            # Header cut short by a crash, nothing follows it: write it again.
+            size = 0
+            open(self.path, 'wb').close()
+        self.file = open(self.path, 'ab')
+        if size == 0:
+            self.file.write(header)
+            size = len(header)
+        self.size = size
+
+    def rotate(self):
+        '''Start a new file, see SampleLog.'''
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        for n in range(self.keep, 0, -1):
+            older = '%s.%d' % (self.path, n)
+            if os.path.exists(older):
+                if n == self.keep:
+                    os.remove(older)
+                else:
+                    os.rename(older, '%s.%d' % (self.path, n + 1))
+        if os.path.exists(self.path):
+            if self.keep:
+                os.rename(self.path, self.path + '.1')
+            else:
+                os.remove(self.path)
+
+    def append(self, timestamp, values):
+        '''
+        Append one record. values is a sequence in column order, or a
+        dictionary; columns missing from it are stored as NaN and keys
+        that are not columns are ignored.
+        '''
+        if hasattr(values, 'items'):
+            row = [_nan] * len(self.columns)
+            index = self.index
+            for key, value in values.items():
+                if key in index:
+                    row[index[key]] = value
+            values = row
+        self.file.write(self.record.pack(timestamp, *values))
+        self.size += self.record.size
+        if self.size >= self.max_bytes:
+            self.rotate()
+            self._open()
+
+    def record_parsed(self, timestamp, parsed, prefix=''):
+        '''Append a parse_* result, flattened to columns with utils.flatten().'''
+        self.append(timestamp, utils.flatten(parsed, prefix))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class Reader(object):
+    '''
+    Read a log file through mmap. Records are unpacked straight from the
+    mapping, nothing is copied into memory up front.
+    '''
+    def __init__(self, path):
+        self.columns = _columns(path)
+        if self.columns is None:
+            raise ValueError('%s: not a sample log' % path)
+        self.index = dict([(c, i) for i, c in enumerate(self.columns)])
+        self.record = struct.Struct('<%dd' % (len(self.columns) + 1))
+        self.offset = len(_header(self.columns))
+        f = open(path, 'rb')
+        try:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            f.close()
+        self.count = (len(self.map) - self.offset) // self.record.size
+
+    def time(self, i):
+        return struct.unpack_from('<d', self.map, self.offset + i * self.record.size)[0]
+
+    def bisect(self, timestamp):
+        '''Index of the first record with time >= timestamp.'''
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.time(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _bounds(self, start, end):
+        first, last = 0, self.count
+        if start is not None:
+            first = self.bisect(start)
+        if end is not None:
+            last = self.bisect(end + 1e-9)
+        return first, last
+
+    def scan(self, start=None, end=None):
+        '''Yield (timestamp, values) for records with start <= time <= end.'''
+        first, last = self._bounds(start, end)
+        unpack, size, base = self.record.unpack_from, self.record.size, self.offset
+        for i in xrange(first, last):
+            row = unpack(self.map, base + i * size)
+            yield row[0], row[1:]
+
+    def column(self, name, start=None, end=None):
+        '''
+        Returned structure is a tuple of arrays:
+        (timestamps, values of column name)
+        '''
+        first, last = self._bounds(start, end)
+        unpack, size = struct.Struct('<d').unpack_from, self.record.size
+        column = self.offset + (self.index[name] + 1) * 8
+        times, values = array('d'), array('d')
+        for i in xrange(first, last):
+            times.append(unpack(self.map, self.offset + i * size)[0])
+            values.append(unpack(self.map, column + i * size)[0])
+        return times, values
+
+    def close(self):
+        self.map.close()
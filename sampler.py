@@ -0,0 +1,133 @@
+import threading
+import select
+import signal
+import time
+import os
+import utils
+
+class Sampler(object):
+    '''
+    Run a command in its interval mode (iostat -w 5, dladm show-link -s -i 5)
+    and keep its latest report, so reading a sample does not fork.
+
+    Output is split into reports on silence: a report is complete when the
+    command writes nothing for quiet seconds. Every report is parsed with
+    parser(data=report) as it arrives. The command is restarted if it exits,
+    or tried again if it could not be run, see report().
+    '''
+    def __init__(self, cmd, parser=None, quiet=0.2, restart=5.0):
+        self.cmd = cmd
+        self.parser = parser
+        self.quiet = quiet
+        self.restart = restart
+        self.lock = threading.Lock()
+        # Latest report as printed by cmd, its parsed form and arrival time.
+        self.data = None
+        self.sample = None
+        self.time = None
+        self.error = None
+        # Error of the last attempt to run cmd, None while it runs.
+        self.failed = None
+        self.restarts = 0
+        self.process = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        '''Start cmd in a background thread.'''
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name='wusu-sampler')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        '''Stop the thread and kill cmd.'''
+        self.stopped.set()
+        p = self.process
+        if p is not None and p.poll() is None:
+            os.kill(p.pid, signal.SIGTERM)
+        if self.thread is not None:
+            self.thread.join()
+
+    def _publish(self, report):
+        data = ''.join(report)
+        sample, error = self.sample, None
+        if self.parser is not None:
+            try:
+                sample = self.parser(data=data)
+            except Exception, e:
+                error = e
+        with self.lock:
+            self.data = data
+            self.sample = sample
+            self.error = error
+            self.time = time.time()
+
+    def _read(self, p):
+        '''Read reports from p until it exits or the sampler is stopped.'''
+        fd = p.stdout.fileno()
+        report = []
+        rest = ''
+        while not self.stopped.is_set():
+            if not select.select([fd], [], [], report and self.quiet or 1.0)[0]:
+                if report:
+                    self._publish(report)
+                    report = []
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            lines = (rest + chunk).split('\n')
+            rest = lines.pop()
+            report.extend([line + '\n' for line in lines])
+        if report and not self.stopped.is_set():
+            self._publish(report)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                self.process = p = utils.popen(self.cmd)
+            except (IOError, OSError), e:
+                # Not installed, out of processes: try again later.
+                self.failed = e
+            else:
+                self.failed = None
+                try:
+                    self._read(p)
+                except (IOError, OSError, select.error), e:
+                    self.failed = e
+                finally:
+                    if p.poll() is None:
+                        os.kill(p.pid, signal.SIGKILL)
+                    p.wait()
+                    p.stdout.close()
+            if self.stopped.wait(self.restart):
+                break
+            self.restarts += 1
+
+    def report(self):
+        '''
+        Latest report as printed by cmd, None before the first one.
+        Raises the error of the last attempt to run cmd when it failed,
+        the report would be stale.
+        '''
+        failed = self.failed
+        if failed is not None:
+            raise failed
+        return self.data
+
+    def parsed(self):
+        '''Latest report as parsed by parser, raises as report() does.'''
+        failed = self.failed
+        if failed is not None:
+            raise failed
+        return self.sample
+
+    def latest(self):
+        '''
+        Returned structure is a tuple:
+        (arrival time, report, parsed report)
+        '''
+        with self.lock:
+            return (self.time, self.data, self.sample)
@@ -0,0 +1,127 @@
+import threading
+import math
+import time
+
+class Job(object):
+    '''A function run every interval seconds, see Scheduler.add().'''
+    def __init__(self, name, func, interval, offset, callbacks):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.offset = offset
+        # Jobs without an offset get one from Scheduler.
+        self.spread = offset is None
+        self.callbacks = callbacks
+        self.next = None
+        self.running = False
+        self.runs = 0
+        self.skipped = 0
+
+    def following(self, now):
+        '''First tick after now, aligned to multiples of interval plus offset.'''
+        ticks = math.floor((now - (self.offset or 0)) / self.interval) + 1
+        return ticks * self.interval + (self.offset or 0)
+
+class Scheduler(object):
+    '''
+    Run collectors (load.*, storage.* methods, or any function) at fixed
+    intervals aligned to wall-clock boundaries: a 60 second job runs at
+    the start of every minute, plus its offset.
+
+    Ticks are computed from the clock every time, so they do not drift.
+    When a run is still going on at its next tick, that tick is skipped,
+    not queued. Jobs added with the same interval and no offset get their
+    offsets spread evenly over the interval, so they do not all fork at once.
+
+    Results are delivered to callbacks:
+    callback(name, tick, result, error)
+    error is the exception raised by the job, result is None then.
+    '''
+    def __init__(self):
+        self.jobs = []
+        self.callbacks = []
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def add(self, func, interval, callback=None, name=None, offset=None):
+        '''
+        Run func every interval seconds.
+        callback gets only this job's results, see subscribe() for all.
+        '''
+        callbacks = callback and [callback] or []
+        job = Job(name or func.__name__, func, interval, offset, callbacks)
+        with self.lock:
+            self.jobs.append(job)
+            self._spread(interval)
+            job.next = job.following(time.time())
+        return job
+
+    def _spread(self, interval):
+        jobs = [j for j in self.jobs if j.interval == interval and j.spread]
+        for i, job in enumerate(jobs):
+            job.offset = float(interval) * i / len(jobs)
+            job.next = job.following(time.time())
+
+    def subscribe(self, callback):
+        '''Deliver results of all jobs to callback.'''
+        self.callbacks.append(callback)
+
+    def _deliver(self, job, tick, result, error):
+        for callback in job.callbacks + self.callbacks:
+            try:
+                callback(job.name, tick, result, error)
+            except Exception:
+                pass
+
+    def _execute(self, job, tick):
+        result, error = None, None
+        try:
+            result = job.func()
+        except Exception, e:
+            error = e
+        job.runs += 1
+        job.running = False
+        self._deliver(job, tick, result, error)
+
+    def run_pending(self, now=None):
+        '''Start every job that is due, return seconds until the next one.'''
+        if now is None:
+            now = time.time()
+        with self.lock:
+            jobs = list(self.jobs)
+        for job in jobs:
+            if job.next > now:
+                continue
+            tick = job.next
+            job.next = job.following(now)
+            if job.running:
+                job.skipped += 1
+                continue
+            job.running = True
+            t = threading.Thread(target=self._execute, args=(job, tick), name='wusu-' + job.name)
+            t.daemon = True
+            t.start()
+        if not jobs:
+            return 1.0
+        return max(min([j.next for j in jobs]) - time.time(), 0)
+
+    def _run(self):
+        while not self.stopped.is_set():
+            wait = self.run_pending()
+            # Sleep in short steps, so stop() does not wait a whole interval.
+            time.sleep(min(wait, 0.5))
+
+    def start(self):
+        '''Run jobs in a background thread.'''
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name='wusu-scheduler')
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        '''Stop starting jobs, runs that are going on finish on their own.'''
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
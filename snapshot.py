@@ -0,0 +1,140 @@
+'''
+Every load and storage metric of the host in one call.
+
+Collectors that fork a command (FreeBSD and SunOS) run at the same time,
+each on its own thread, so a snapshot takes as long as the slowest of them
+instead of all of them together. Collectors reading /proc or calling
+statvfs(2) are cheaper than starting a thread and run inline.
+'''
+import threading
+import time
+import os
+import load
+import storage
+
+METRICS = ('uptime', 'memory', 'swap', 'loadavg', 'ifstat', 'fsusage', 'inodes', 'iostat')
+
+class Snapshot(object):
+    '''
+    Collect all METRICS of system, the running one by default.
+    Collectors are kept between snapshots, so iostat rates on Linux
+    cover the time since the previous snapshot.
+    '''
+    def __init__(self, system=None, loads=None, storages=None, timeout=None):
+        '''
+        loads, storages - load.* and storage.* collectors to use instead of
+            new ones, e.g. cache.Cached or replay collectors
+        timeout - seconds to wait for threaded collectors, the ones still
+            running then are reported as failed
+        '''
+        self.system = system or os.uname()[0]
+        self.load = loads or getattr(load, self.system)()
+        self.storage = storages or getattr(storage, self.system)()
+        self.timeout = timeout
+
+    def jobs(self):
+        '''
+        Returned structure is a list of tuples:
+        [(metrics, function, inline), ...]
+        function returns a tuple of results, one for each of metrics.
+        '''
+        l, s = self.load, self.storage
+        forks = self.system != 'Linux'
+        jobs = [
+            # FreeBSD reads uptime through clock_gettime(2), SunOS forks kstat.
+            (('uptime',), l.parse_uptime, self.system != 'SunOS'),
+            (('memory',), l.parse_memory, not forks),
+            (('swap',), l.parse_swap, not forks),
+            (('loadavg',), l.parse_loadavg, not forks),
+            (('ifstat',), l.parse_ifstat, not forks),
+            (('iostat',), s.parse_iostat, not forks),
+        ]
+        if hasattr(s, 'parse_filesystems'):
+            # One statvfs(2) pass for both.
+            jobs.append((('fsusage', 'inodes'), s.parse_filesystems, True))
+        elif self.system == 'FreeBSD':
+            # df -i reports both.
+            jobs.append((('fsusage', 'inodes'), lambda: (s.parse_fsusage(),) * 2, False))
+        else:
+            jobs.append((('fsusage',), s.parse_fsusage, False))
+            jobs.append((('inodes',), s.parse_inodes, False))
+        return jobs
+
+    def _run(self, metrics, func, outcome):
+        start = time.time()
+        try:
+            result = func()
+            if len(metrics) == 1:
+                result = (result,)
+            outcome['result'] = result
+        except Exception, e:
+            outcome['error'] = '%s: %s' % (e.__class__.__name__, e)
+        outcome['latency'] = time.time() - start
+
+    def take(self, metrics=None):
+        '''
+        Collect metrics, all METRICS by default.
+        Results are None for collectors that failed, their errors are
+        reported in errors. Latency is in seconds, collectors answering
+        more than one metric report the same latency for all of them.
+
+        Returned structure is a dictionary:
+        {'time': value,
+        'system': value,
+        'duration': value,
+        'metrics': {metric: result, ...},
+        'latency': {metric: value, ...},
+        'errors': {metric: error, ...}}
+        '''
+        wanted = set(metrics or METRICS)
+        jobs = [job for job in self.jobs() if wanted.intersection(job[0])]
+        outcomes = [{} for job in jobs]
+        now = time.time()
+        threads = []
+        for (names, func, inline), outcome in zip(jobs, outcomes):
+            if not inline:
+                t = threading.Thread(target=self._run, args=(names, func, outcome), name='wusu-snapshot')
+                t.daemon = True
+                t.start()
+                threads.append(t)
+        # Inline collectors run while the threaded ones wait for their commands.
+        for (names, func, inline), outcome in zip(jobs, outcomes):
+            if inline:
+                self._run(names, func, outcome)
+        for t in threads:
+            if self.timeout is None:
+                t.join()
+            else:
+                t.join(max(now + self.timeout - time.time(), 0))
+        snapshot = {'time': now, 'system': self.system, 'metrics': {}, 'latency': {}, 'errors': {}}
+        for (names, func, inline), outcome in zip(jobs, outcomes):
+            # dict() copies the outcome, a late thread can not change it.
+            outcome = dict(outcome)
+            for i, name in enumerate(names):
+                if name not in wanted:
+                    continue
+                result = outcome.get('result', (None,) * len(names))[i]
+                snapshot['metrics'][name] = result
+                if 'latency' in outcome:
+                    snapshot['latency'][name] = outcome['latency']
+                if 'error' in outcome:
+                    snapshot['errors'][name] = outcome['error']
+                elif 'latency' not in outcome:
+                    snapshot['errors'][name] = 'timed out'
+                elif result is None:
+                    snapshot['errors'][name] = 'no output'
+        snapshot['duration'] = time.time() - now
+        return snapshot
+
+_default = []
+_lock = threading.Lock()
+
+def snapshot(metrics=None):
+    '''
+    Snapshot of the running system with collectors shared between calls,
+    see Snapshot.take().
+    '''
+    with _lock:
+        if not _default:
+            _default.append(Snapshot())
+    return _default[0].take(metrics)
@@ -1,28 +1,146 @@
 import utils
+import os
 
 class Linux(object):
     '''
     Linux related storage information.
     '''
-    def __init__(self, path=''):
+    def __init__(self, path='', fstypes=(), exclude_fstypes=(), timeout=2.0, backoff=60.0, workers=8):
+        '''
+        fstypes - only report filesystems of these types, e.g. ('ext4', 'xfs')
+        exclude_fstypes - never report filesystems of these types, e.g. ('tmpfs', 'overlay', 'squashfs')
+        Both filters are applied to /proc/self/mountinfo, before statvfs(2) is called.
+
+        timeout - seconds a mount may take to answer statvfs(2)
+        backoff - seconds an unresponsive mount is skipped for
+        workers - number of threads calling statvfs(2)
+        '''
+        import probe
         self.path = path
-        self.inodes = 'df -i -P %s' % self.path
-        self.fsusage = 'df -k -P %s' % self.path
-        self.iostat = 'iostat -d -N -k -x %s' % self.path
+        self.prober = probe.Prober(os.statvfs, workers, timeout, backoff)
+        self.fstypes = fstypes
+        self.exclude_fstypes = exclude_fstypes
+        self.mountinfo = '/proc/self/mountinfo'
+        # Shared mounts.MountTable, opened by the first get_mounts().
+        self.mounttable = None
+        self.inodes = self.mountinfo
+        self.fsusage = self.mountinfo
+        self.iostat = '/proc/diskstats'
+        self.blockstat = '/sys/block/%s/stat'
+        self.dmname = '/sys/block/%s/dm/name'
+        self.uptime = '/proc/uptime'
+        # Previous /proc/diskstats sample: (uptime, counters).
+        self.iostat_sample = (0.0, {})
+        self.dmnames = {}
 
-    def get_inodes(self):
-        '''Inodes info.'''
-        return utils.run(self.inodes)
+    def get_mounts(self, match=None):
+        '''
+        Mounted filesystems from /proc/self/mountinfo, filtered by fstype
+        and by match, see utils.matcher().
+        If path is set, only the filesystem containing path is returned.
+        mountinfo is only read again after the kernel reports a change,
+        see mounts.MountTable.
+        Returned structure is a list of tuples:
+        [(device, mount, fstype), ...]
+        '''
+        if self.mounttable is None:
+            import mounts
+            self.mounttable = mounts.table(self.mountinfo)
+        table = self.mounttable.mounts(self.fstypes, self.exclude_fstypes, match)
+        if self.path:
+            path = os.path.realpath(self.path)
+            table = [m for m in table if path == m[1] or path.startswith(m[1].rstrip('/') + '/')]
+            table = sorted(table, key=lambda m: len(m[1]))[-1:]
+        return table
 
-    def get_fsusage(self):
-        '''Usage info in Kb.'''
-        return utils.run(self.fsusage)
+    def get_statvfs(self, match=None):
+        '''
+        Call statvfs(2) once for every device returned by get_mounts(match).
+        Only devices with a path (/dev/sda1, not tmpfs or overlay) are
+        reported, as df -P parsing did, so rows keyed by device do not
+        overwrite each other. When a device is mounted more than once
+        only the first mount is used.
+        Mounts are probed in parallel, the ones that do not answer in time
+        are left out, see unresponsive().
+        Returned structure is a list of tuples:
+        [(device, mount, fstype, statvfs), ...]
+        '''
+        mounts = []
+        seen = set()
+        for device, mount, fstype in self.get_mounts(match):
+            if device in seen or not device.startswith('/'):
+                continue
+            seen.add(device)
+            mounts.append((device, mount, fstype))
+        results = self.prober.probe([m[1] for m in mounts])
+        return [(d, m, t, tuple(results[m])) for d, m, t in mounts if m in results]
+
+    def unresponsive(self):
+        '''
+        Mounts that did not answer statvfs(2) in time and are skipped.
+        Returned structure is a dictionary:
+        {mount: seconds until next probe}
+        '''
+        from time import time
+        now = time()
+        with self.prober.lock:
+            return dict([(m, max(t - now, 0)) for m, t in self.prober.unresponsive.items()])
+
+    def get_inodes(self, match=None):
+        '''Inodes info, see get_statvfs().'''
+        return self.get_statvfs(match)
+
+    def get_fsusage(self, match=None):
+        '''Usage info, see get_statvfs().'''
+        return self.get_statvfs(match)
 
     def get_iostat(self):
-        '''IOstat info.'''
-        return utils.run(self.iostat)
+        '''
+        IOstat info from /proc/diskstats.
+        If path names a block device, only /sys/block/<path>/stat is read.
+        '''
+        device = os.path.basename(self.path)
+        if device and os.path.exists(self.blockstat % device):
+            f = open(self.blockstat % device, 'r', 0)
+            # Make it look like a /proc/diskstats line.
+            data = '0 0 %s %s' % (device, f.read())
+            f.close()
+            return data
+        f = open(self.iostat, 'r', 0)
+        data = f.read()
+        f.close()
+        return data
+
+    def get_uptime(self):
+        '''Seconds since boot, the clock get_iostat() counters are compared over.'''
+        f = open(self.uptime, 'r', 0)
+        data = f.read()
+        f.close()
+        return data
 
-    def parse_inodes(self):
+    def get_devices(self):
+        '''
+        Mount points of block devices as named by parse_iostat().
+        Returned structure is a dictionary:
+        {device: [mount, ...]}
+        '''
+        if self.mounttable is None:
+            import mounts
+            self.mounttable = mounts.table(self.mountinfo)
+        return self.mounttable.devices()
+
+    def get_dmname(self, device):
+        '''Device mapper name of dm-N device, as shown by iostat -N.'''
+        if device not in self.dmnames:
+            try:
+                f = open(self.dmname % device, 'r', 0)
+                self.dmnames[device] = f.read().strip()
+                f.close()
+            except IOError:
+                self.dmnames[device] = device
+        return self.dmnames[device]
+
+    def parse_inodes(self, typed=False, include=(), exclude=(), data=None):
         '''
         Parse output of get_inodes()
         Returned structure is a dictionary of dictionaries:
@@ -39,11 +157,16 @@ class Linux(object):
         percent - amount of used inodes in percent
         free - amount of free inodes
         inodes - amount of all inodes
+
+        include, exclude - device or mount point patterns, see utils.matcher()
+        Mounts are filtered before statvfs(2) is called.
         '''
-        fields = ('inodes', 'used', 'free', 'percent', 'mount')
-        return utils.parser_storage(self.get_inodes(), fields)
+        match = utils.matcher(include, exclude)
+        if data is None:
+            data = self.get_inodes(match)
+        return utils.parser_statvfs_inodes(data, typed, match)
 
-    def parse_fsusage(self):
+    def parse_fsusage(self, typed=False, include=(), exclude=(), data=None):
         '''
         Parse output of get_fsusage().
         Returned structure is a dictionary of dictionaries:
@@ -60,11 +183,27 @@ class Linux(object):
         percent - amount of used disk space in percent
         free - amount of free disk space in Kb
         size - amount of all disk space in kB
+
+        include, exclude - device or mount point patterns, see utils.matcher()
+        Mounts are filtered before statvfs(2) is called.
         '''
-        fields = ('size', 'used', 'free', 'percent', 'mount')
-        return utils.parser_storage(self.get_fsusage(), fields)
+        match = utils.matcher(include, exclude)
+        if data is None:
+            data = self.get_fsusage(match)
+        return utils.parser_statvfs_fsusage(data, typed, match)
 
-    def parse_iostat(self):
+    def parse_filesystems(self, typed=False, include=(), exclude=(), data=None):
+        '''
+        Parse fsusage and inodes from a single get_statvfs() pass.
+        Returned structure is a tuple:
+        (parse_fsusage(), parse_inodes())
+        '''
+        match = utils.matcher(include, exclude)
+        if data is None:
+            data = self.get_statvfs(match)
+        return (utils.parser_statvfs_fsusage(data, typed, match), utils.parser_statvfs_inodes(data, typed, match))
+
+    def parse_iostat(self, typed=False, include=(), exclude=(), data=None):
         '''
         Parse output of get_iostat().
         Returned structure is a dictionary of dictionaries:
@@ -77,7 +216,8 @@ class Linux(object):
             'avgrq-sz': value,
             'avgqu-sz': value,
             'await': value,
-            'svctm': value}
+            'svctm': value,
+            'util': value}
         }
 
         tps - transfers per second
@@ -89,9 +229,34 @@ class Linux(object):
         avgqu-sz - The average queue length of the requests that were issued to the device.
         await - The average time (in milliseconds) for I/O requests issued to the device to be served. This includes the time  spent  by the requests in queue and the time spent servicing them.
         svctm - The average service time (in milliseconds) for I/O requests that were issued to the device.
+        util - Percentage of elapsed time during which I/O requests were issued to the device.
+
+        Rates are computed over the interval since the previous call,
+        whatever devices it included,
+        the first call returns averages since boot.
+
+        include, exclude - device or mount point patterns, see utils.matcher();
+            device mapper devices are matched by their dm-N and their mapped name
         '''
-        fields = ('tps', 'kbrs', 'kbws', 'kbr', 'kbw', 'avgrq-sz', 'avgqu-sz', 'await', 'svctm')
-        return utils.parser_iostat(self.get_iostat(), fields)
+        if data is None:
+            data = self.get_iostat()
+        match = utils.matcher(include, exclude)
+        if match:
+            names = match
+            devices = self.get_devices()
+            def match(device):
+                if device.startswith('dm-'):
+                    name = self.get_dmname(device)
+                    return names(device, name, *devices.get(name, ()))
+                return names(device, *devices.get(device, ()))
+        now = float(self.get_uptime().split()[0])
+        then, previous = self.iostat_sample
+        parsed, counters = utils.parser_diskstats(data, previous, max(now - then, 0.01), typed, match)
+        self.iostat_sample = (now, counters)
+        for device in parsed.keys():
+            if device.startswith('dm-'):
+                parsed[self.get_dmname(device)] = parsed.pop(device)
+        return parsed
 
 class FreeBSD(object):
     '''
@@ -100,10 +265,23 @@ class FreeBSD(object):
     that is why get_fsusage, get_inode and parse_fsusage, parse_inode
     are the same.
     '''
-    def __init__(self, path=''):
+    def __init__(self, path='', fstypes=(), exclude_fstypes=()):
+        '''
+        fstypes - only report filesystems of these types, e.g. ('ufs', 'zfs')
+        exclude_fstypes - never report filesystems of these types, e.g. ('devfs', 'nullfs')
+        Both filters are passed on to df -t.
+        '''
         self.path = path
         self.fsusage = 'df -k -i %s' % self.path
+        if fstypes:
+            types = [t for t in fstypes if t not in exclude_fstypes]
+            self.fsusage = 'df -k -i -t %s %s' % (','.join(types), self.path)
+        elif exclude_fstypes:
+            # A 'no' prefix excludes all types of the list.
+            self.fsusage = 'df -k -i -t no%s %s' % (','.join(exclude_fstypes), self.path)
+        self.inodes = self.fsusage
         self.iostat = 'iostat -d -x -K -I %s' % self.path
+        self.iostat_sampler = None
 
     def get_inodes(self):
         '''FS usage and inodes info.'''
@@ -113,11 +291,32 @@ class FreeBSD(object):
         '''See get_inodes().'''
         return self.get_inodes()
 
-    def get_iostat(self):
-        '''IOstat info.'''
+    def get_iostat(self, devices=None):
+        '''
+        IOstat info, of devices only if given.
+        With sample_iostat() running, the latest report is returned without forking.
+        Raises the error of the sampler's command when it could not be run.
+        '''
+        if self.iostat_sampler is not None:
+            report = self.iostat_sampler.report()
+            # None until the first interval ends, iostat runs once meanwhile.
+            if report is not None:
+                return report
+        if devices:
+            return utils.run('%s %s' % (self.iostat, ' '.join(devices)))
         return utils.run(self.iostat)
 
-    def parse_inodes(self):
+    def sample_iostat(self, interval=5):
+        '''
+        Keep iostat running in interval mode, see sampler.Sampler.
+        Values become totals for the last interval seconds.
+        '''
+        cmd = 'iostat -d -x -K -I -w %d %s' % (interval, self.path)
+        import sampler
+        self.iostat_sampler = sampler.Sampler(cmd, self.parse_iostat).start()
+        return self.iostat_sampler
+
+    def parse_inodes(self, typed=False, include=(), exclude=(), data=None):
         '''
         Parse output of get_inodes().
         Returned structure is a dictionary of dictionaries:
@@ -140,17 +339,21 @@ class FreeBSD(object):
         ifree - amount of free inodes
         ipercent - amount of used inodes in percent
         mount - mount point
+
+        include, exclude - device or mount point patterns, see utils.matcher()
         '''
+        if data is None:
+            data = self.get_inodes()
         fields = ('blocks', 'used', 'free', 'percent', 'iused', 'ifree', 'ipercent', 'mount')
-        return utils.parser_storage(self.get_inodes(), fields)
+        return utils.parser_storage(data, fields, typed, utils.matcher(include, exclude))
 
-    def parse_fsusage(self):
+    def parse_fsusage(self, typed=False, include=(), exclude=(), data=None):
         '''See parse_inodes().'''
-        return self.parse_inodes()
+        return self.parse_inodes(typed, include, exclude, data)
 
-    def parse_iostat(self):
+    def parse_iostat(self, typed=False, include=(), exclude=(), data=None):
         '''
-        Parse output of get_iostat().
+        Parse output of get_iostat(), or data if given.
         Returned structure is a dictionary of dictionaries.
         {device:
             {'rs': value,
@@ -169,9 +372,19 @@ class FreeBSD(object):
         wait - transactions queue length
         svc_t - average duration of transactions, in milliseconds
         b (%b) - % of time the device had one or more outstanding transactions
+
+        include, exclude - device patterns, see utils.matcher()
+        Plain device names in include are passed on to iostat.
         '''
         fields = ('rs', 'ws', 'krs', 'kws', 'wait', 'svc_t', 'b')
-        return utils.parser_iostat(self.get_iostat(), fields)
+        match = utils.matcher(include, exclude)
+        if data is None:
+            if self.iostat_sampler is not None and not typed and match is None:
+                sample = self.iostat_sampler.parsed()
+                if sample is not None:
+                    return sample
+            data = self.get_iostat(utils.literals(include))
+        return utils.parser_iostat_freebsd(data, fields, typed, match)
 
 class SunOS(object):
     def __init__(self, path = ''):
@@ -179,6 +392,7 @@ class SunOS(object):
         self.inodes = 'df -o i %s' % self.path
         self.fsusage = 'df -k %s' % self.path
         self.iostat = 'iostat -n -x -I %s' % self.path
+        self.iostat_sampler = None
 
     def get_inodes(self):
         '''Inodes info.'''
@@ -188,11 +402,32 @@ class SunOS(object):
         '''FS usage info.'''
         return utils.run(self.fsusage)
 
-    def get_iostat(self):
-        '''IOstat info.'''
+    def get_iostat(self, devices=None):
+        '''
+        IOstat info, of devices only if given.
+        With sample_iostat() running, the latest report is returned without forking.
+        Raises the error of the sampler's command when it could not be run.
+        '''
+        if self.iostat_sampler is not None:
+            report = self.iostat_sampler.report()
+            # None until the first interval ends, iostat runs once meanwhile.
+            if report is not None:
+                return report
+        if devices:
+            return utils.run('%s %s' % (self.iostat, ' '.join(devices)))
         return utils.run(self.iostat)
 
-    def parse_inodes(self):
+    def sample_iostat(self, interval=5):
+        '''
+        Keep iostat running in interval mode, see sampler.Sampler.
+        Values become totals for the last interval seconds.
+        '''
+        cmd = '%s %d' % (self.iostat, interval)
+        import sampler
+        self.iostat_sampler = sampler.Sampler(cmd, self.parse_iostat).start()
+        return self.iostat_sampler
+
+    def parse_inodes(self, typed=False, include=(), exclude=(), data=None):
         '''
         Parse ouput of get_inodes().
         Returned structure is a dictionary of dictionaries:
@@ -206,11 +441,15 @@ class SunOS(object):
         used - amount of used inodes
         free - amount of free inodes
         percent - amount of used inodes in percent
+
+        include, exclude - device or mount point patterns, see utils.matcher()
         '''
+        if data is None:
+            data = self.get_inodes()
         fields = ('used', 'free', 'percent', 'mount')
-        return utils.parser_storage(self.get_inodes(), fields)
+        return utils.parser_storage(data, fields, typed, utils.matcher(include, exclude))
 
-    def parse_fsusage(self):
+    def parse_fsusage(self, typed=False, include=(), exclude=(), data=None):
         '''
         Parse output of get_fsusage().
         Returned structure is a dictionary of dictionaries:
@@ -227,13 +466,17 @@ class SunOS(object):
         free - amount of free disk space in Kb
         percent - amount of used disk space in percent
         mount - mount point
+
+        include, exclude - device or mount point patterns, see utils.matcher()
         '''
+        if data is None:
+            data = self.get_fsusage()
         fields = ('kbytes', 'used', 'free', 'percent', 'mount')
-        return utils.parser_storage(self.get_fsusage(), fields)
+        return utils.parser_storage(data, fields, typed, utils.matcher(include, exclude))
 
-    def parse_iostat(self):
+    def parse_iostat(self, typed=False, include=(), exclude=(), data=None):
         '''
-        Parse output of get_iostat().
+        Parse output of get_iostat(), or data if given.
         Returned structure is a dictionary of dictionaries:
         {device:
             {'rs': value,
@@ -257,9 +500,19 @@ class SunOS(object):
         svc_t - average response time  of  transactions,  in  milliseconds
         w - percent of time there are transactions waiting for service (queue not-empty)
         b - percent of time the disk is busy (transactions in progress)
+
+        include, exclude - device patterns, see utils.matcher()
+        Plain device names in include are passed on to iostat.
         '''
         fields = ('rs', 'ws', 'krs', 'kws', 'wait', 'actv', 'svc_t', 'w', 'b')
-        return utils.parser_iostat(self.get_iostat(), fields)
+        match = utils.matcher(include, exclude)
+        if data is None:
+            if self.iostat_sampler is not None and not typed and match is None:
+                sample = self.iostat_sampler.parsed()
+                if sample is not None:
+                    return sample
+            data = self.get_iostat(utils.literals(include))
+        return utils.parser_iostat_sunos(data, fields, typed, match)
 
 if __name__ == '__main__':
     print "not yet"
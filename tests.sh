@@ -1,7 +1,7 @@
 #!/bin/sh
 
 echo "Test load module ..."
-python <<EOF
+python <<EOF || exit 1
 from load import `uname`
 a = `uname`()
 print "get_uptime()"
@@ -37,7 +37,7 @@ print
 EOF
 
 echo "Test storage module ..."
-python <<EOF
+python <<EOF || exit 1
 from storage import `uname`
 a = `uname`()
 print "get_inodes()"
@@ -58,6 +58,401 @@ print
 print "parse_fsusage()"
 print a.parse_fsusage()
 print
+# Devices without a path (tmpfs at /run and /dev/shm) would overwrite each other.
+assert [d for d in a.parse_fsusage() if not d.startswith('/')] == []
+EOF
+
+echo "Test probe module ..."
+python <<EOF || exit 1
+import probe, os, time
+def statvfs(path):
+    # Stand-in for a hung NFS or FUSE mount.
+    if path == '/hung':
+        time.sleep(3600)
+    return os.statvfs(path)
+a = probe.Prober(statvfs, timeout=0.5, backoff=10)
+print "probe(['/', '/hung'])"
+print sorted(a.probe(['/', '/hung']).keys())
+print "unresponsive"
+print a.unresponsive.keys()
+print
+EOF
+
+echo "Test mounts module ..."
+python <<EOF || exit 1
+import mounts
+a = mounts.table()
+print "mounts()"
+print a.mounts()
+print
+print "devices()"
+print a.devices()
+print
+EOF
+
+echo "Test procfile module ..."
+python <<EOF || exit 1
+import procfile
+import tempfile
+f = tempfile.NamedTemporaryFile()
+f.write(''.join(['line %d\\n' % i for i in range(5000)]))
+f.flush()
+# /proc/kallsyms is a seq_file returning about a page per read(2).
+for path in (f.name, '/proc/kallsyms'):
+    try:
+        expected = open(path).read()
+    except IOError:
+        continue
+    print "ProcFile('%s').read(), %d bytes" % (path, len(expected))
+    assert procfile.ProcFile(path).read() == expected
+print
+EOF
+
+echo "Test cache module ..."
+python <<EOF || exit 1
+import cache
+import threading
+import time
+class Collector(object):
+    calls = 0
+    def get_thing(self):
+        self.calls += 1
+        time.sleep(0.1)
+        return self.calls
+a = cache.Cached(Collector(), {'thing': 0.5})
+threads = [threading.Thread(target=a.get_thing) for i in range(4)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+# One collection shared by all threads, answered from cache until it expires.
+assert a.get_thing() == 1
+time.sleep(0.5)
+assert a.get_thing() == 2
+print "stats()"
+print a.stats()
+print
+EOF
+
+echo "Test rates module ..."
+python <<EOF || exit 1
+import rates
+a = rates.Rates()
+a.update({'eth0': {'bytes': 4000000000}}, now=0)
+print "update() after a reset"
+print a.update({'eth0': {'bytes': 1000}}, now=1)
+# A 64-bit counter going backwards was reset, it did not wrap.
+assert a.update({'eth0': {'bytes': 3000}}, now=2) == {'eth0': {'bytes': {'counter': 3000, 'rate': 2000.0}}}
+assert a.resets == 1 and a.wraps == 0
+a = rates.Rates(width=32)
+a.update({'eth0': {'bytes': 2 ** 32 - 100}}, now=0)
+assert a.update({'eth0': {'bytes': 100}}, now=2)['eth0']['bytes']['rate'] == 100.0
+assert a.wraps == 1
+print
+EOF
+
+echo "Test scheduler module ..."
+python <<EOF || exit 1
+import scheduler
+import threading
+import time
+release = threading.Event()
+ticks = []
+a = scheduler.Scheduler()
+job = a.add(release.wait, 10, callback=lambda name, tick, result, error: ticks.append(tick), offset=0)
+first = job.next
+a.run_pending(now=first)
+# The first run is still going on at the next tick, which is skipped.
+a.run_pending(now=first + 10)
+assert job.skipped == 1 and job.next == first + 20
+release.set()
+while not ticks:
+    time.sleep(0.01)
+print "ticks, runs, skipped"
+print ticks, job.runs, job.skipped
+assert ticks == [first] and first % 10 == 0 and job.runs == 1
+print
+EOF
+
+echo "Test history module ..."
+python <<EOF || exit 1
+import history
+a = history.History(raw=5, tiers=((10, 3),))
+for t in range(100):
+    a.add('x', t, t)
+nbytes = a.nbytes()
+# Raw samples wrap around, the oldest are overwritten.
+print "query('x'), query('x', tier=10)"
+print a.query('x'), a.query('x', tier=10)
+assert a.query('x') == [(95.0, 95.0), (96.0, 96.0), (97.0, 97.0), (98.0, 98.0), (99.0, 99.0)]
+assert a.query('x', 96, 98) == [(96.0, 96.0), (97.0, 97.0), (98.0, 98.0)]
+# Three finished buckets and the one being filled.
+assert a.query('x', tier=10) == [(60.0, 60.0, 69.0, 64.5), (70.0, 70.0, 79.0, 74.5), (80.0, 80.0, 89.0, 84.5), (90.0, 90.0, 99.0, 94.5)]
+for t in range(100, 1000):
+    a.add('x', t, t)
+assert a.nbytes() == nbytes
+print
+EOF
+
+echo "Test samplelog module ..."
+python <<EOF || exit 1
+import os, shutil, tempfile
+import samplelog
+d = tempfile.mkdtemp()
+try:
+    p = os.path.join(d, 'log')
+    columns = ('a', 'b')
+    header = samplelog._header(columns)
+    record = 8 * (len(columns) + 1)
+    # A header cut short by a crash is rewritten, not rotated away.
+    for cut in (3, samplelog._head.size, len(header) - 2):
+        open(p, 'wb').write(header[:cut])
+        a = samplelog.SampleLog(p, columns)
+        a.append(1.0, (2.0, 3.0))
+        a.close()
+        assert os.path.getsize(p) == len(header) + record
+        assert samplelog._columns(p) == columns
+        assert samplelog.files(p) == [p]
+    r = samplelog.Reader(p)
+    print "Reader().columns, scan()"
+    print r.columns, list(r.scan())
+    assert list(r.scan()) == [(1.0, (2.0, 3.0))]
+    r.close()
+    print
+finally:
+    shutil.rmtree(d)
+EOF
+
+echo "Test records module ..."
+python <<EOF || exit 1
+import records
+assert [records.number(v) for v in ('12', '1.5', '34%', '-', 'eth0')] == [12, 1.5, 34, None, 'eth0']
+Disk = records.record(('tps', 'avgrq-sz', 'in'), 'Disk')
+assert records.record(('tps', 'avgrq-sz', 'in'), 'Disk') is Disk
+a = records.maker(Disk._keys, True, 'Disk')(('3', '8.5', '-'))
+print "Disk(), as_dict()"
+print a, a.as_dict()
+assert (a.tps, a.avgrq_sz, a.in_) == (3, 8.5, None)
+assert a['avgrq-sz'] == 8.5 and 'in' in a and a.get('out', 0) == 0
+assert a == {'tps': 3, 'avgrq-sz': 8.5, 'in': None} and a != {'tps': '3'}
+assert records.as_dict({'sda': a}) == {'sda': a.as_dict()}
+try:
+    a['out']
+    raise AssertionError('missing key')
+except KeyError:
+    pass
+print
+EOF
+
+echo "Test processes ..."
+python <<EOF || exit 1
+import load
+a = load.Linux()
+data = a.get_processes()
+every = a.parse_processes(typed=True, data=data)
+top = a.parse_processes(typed=True, top=3, key='rss', data=data)
+print "parse_processes(top=3, key='rss')"
+print top
+largest = sorted([p['rss'] for p in every.values()], reverse=True)[:3]
+assert len(top) == 3 and sorted([p['rss'] for p in top.values()], reverse=True) == largest
+# Only the top processes get statm and io read.
+top = a.parse_processes(top=2, key='cpu')
+assert len(top) == 2 and [p for p in top.values() if p['data'] == '-'] == []
+print
+EOF
+
+echo "Test cpustat ..."
+python <<EOF || exit 1
+import load
+a = load.Linux()
+first = 'cpu  100 0 100 800 0 0 0 0 0 0\ncpu0 100 0 100 800 0 0 0 0 0 0\nintr 1 0\n'
+second = 'cpu  200 0 100 900 0 0 0 0 0 0\ncpu0 200 0 100 900 0 0 0 0 0 0\nintr 1 0\n'
+# Since boot on the first call, since the previous one after that.
+assert a.parse_cpustat(typed=True, data=first)['cpu0'].values()[:4] == [10.0, 0.0, 10.0, 80.0]
+assert a.parse_cpustat(typed=True, data=second)['cpu0'].values()[:4] == [50.0, 0.0, 0.0, 50.0]
+# A CPU going online starts over, old kernels have no steal column.
+third = 'cpu  300 0 100 1000 0 0 0\ncpu0 200 0 100 900 0 0 0\ncpu1 100 0 0 100 0 0 0\n'
+parsed = a.parse_cpustat(include=('cpu1',), data=third)
+assert parsed.keys() == ['cpu1'] and parsed['cpu1']['user'] == '50.00' and parsed['cpu1']['steal'] == '0.00'
+a = load.Linux()
+a.parse_cpustat()
+parsed = a.parse_cpustat(typed=True)
+print "parse_cpustat(typed=True)"
+print parsed
+assert [c for c in parsed.values() if not 99 < sum(c.values()) < 101 and sum(c.values()) != 0] == []
+print
+EOF
+
+echo "Test cgroups module ..."
+python <<EOF || exit 1
+import os, shutil, tempfile
+import cgroups
+d = tempfile.mkdtemp()
+def write(name, data):
+    open(os.path.join(d, name), 'w').write(data)
+try:
+    os.mkdir(os.path.join(d, 'a'))
+    write('a/cgroup.events', 'populated 0\n')
+    write('a/cpu.stat', 'usage_usec 1\n')
+    write('a/cpu.pressure', 'some avg10=1.00\n')
+    t = cgroups.Tree(d)
+    files = ('cpu.stat', 'cpu.pressure')
+    print "Tree().collect()"
+    print t.collect(files)
+    assert t.collect(files)['/a'] == {'cpu.stat': 'usage_usec 1\n', 'cpu.pressure': 'some avg10=1.00\n'}
+    write('a/cpu.stat', 'usage_usec 2\n')
+    write('a/cpu.pressure', 'some avg10=2.00\n')
+    if t.inotify is not None:
+        # Without processes cpu.stat comes from the cache, pressure is read again.
+        assert t.collect(files)['/a'] == {'cpu.stat': 'usage_usec 1\n', 'cpu.pressure': 'some avg10=2.00\n'}
+        write('a/cgroup.events', 'populated 1\n')
+    assert t.collect(files)['/a']['cpu.stat'] == 'usage_usec 2\n'
+    os.mkdir(os.path.join(d, 'a', 'b'))
+    assert sorted(t.collect(files)) == ['/', '/a', '/a/b']
+    os.rmdir(os.path.join(d, 'a', 'b'))
+    assert sorted(t.collect(files)) == ['/', '/a']
+    print
+finally:
+    shutil.rmtree(d)
+EOF
+
+echo "Test snapshot module ..."
+python <<EOF || exit 1
+import snapshot
+a = snapshot.snapshot()
+print "snapshot() metrics, errors"
+print sorted(a['metrics'].keys()), a['errors']
+print
+EOF
+
+echo "Test replay module ..."
+python <<EOF || exit 1
+import replay
+for module, sysname in replay.systems():
+    a = replay.replay(replay.synthetic(module, sysname, 2))
+    for name in sorted(dir(a)):
+        if name.startswith('parse_') and (name != 'parse_memory_usage' or sysname == 'Linux'):
+            print '%s.%s.%s()' % (module, sysname, name)
+            print getattr(a, name)()
+    # typed comes first, data is the last argument.
+    if module == 'load':
+        assert a.parse_swap(True) == a.parse_swap(typed=True)
+print
+EOF
+
+echo "Test parsers with lines ..."
+python <<EOF || exit 1
+import replay
+# Parsers take output as a string or as lines, see utils.run(lines=True).
+for module, sysname in replay.systems():
+    fixture = replay.synthetic(module, sysname, 2)
+    # Command output, not the /proc/uptime storage.Linux reads for iostat rates.
+    lines = dict(fixture, outputs=dict([(name, isinstance(output, basestring) and name != 'get_uptime'
+        and output.splitlines(True) or output) for name, output in fixture['outputs'].items()]))
+    a, b = replay.replay(fixture), replay.replay(lines)
+    for name in sorted(dir(a)):
+        # SunOS uptime changes between two calls.
+        if name == 'parse_uptime' and sysname == 'SunOS' or name == 'parse_memory_usage' and sysname != 'Linux':
+            continue
+        if name.startswith('parse_'):
+            assert getattr(a, name)() == getattr(b, name)(), (module, sysname, name)
+    print '%s.%s parsers take lines' % (module, sysname)
+print
+EOF
+
+echo "Test sampler module ..."
+python <<EOF || exit 1
+import os
+import tempfile
+import replay
+import sampler
+import storage
+fixture = replay.synthetic('storage', 'FreeBSD', 2)['outputs']['get_iostat']
+fd, path = tempfile.mkstemp()
+os.write(fd, fixture)
+os.close(fd)
+a = storage.FreeBSD()
+a.iostat = 'cat %s' % path
+# A sampler that has no report yet: iostat runs once instead.
+a.iostat_sampler = sampler.Sampler('sleep 60').start()
+assert sorted(a.parse_iostat()) == sorted(a.parse_iostat(typed=True)) == ['ada0', 'ada1']
+assert a.parse_iostat(include=('ada0*',)).keys() == ['ada0']
+print "parse_iostat() before the first report"
+print a.parse_iostat()
+print
+a.iostat_sampler.stop()
+os.remove(path)
+EOF
+
+echo "Test nonblocking module ..."
+python <<EOF || exit 1
+import nonblocking
+import load
+import utils
+loop = nonblocking.Loop()
+a = load.FreeBSD()
+a.loadavg = 'echo 0.10 0.20 0.30'
+b = load.FreeBSD()
+b.swap = 'sleep 5'
+c = load.FreeBSD()
+c.swap = 'sleep 5'
+requests = [loop.submit(a, 'parse_loadavg', typed=True), loop.submit(b, 'get_swap', timeout=0.2), loop.submit(c, 'get_swap')]
+requests[2].cancel()
+loop.wait(requests)
+print "submit() results, errors"
+print [(r.result, r.error) for r in requests]
+assert requests[0].result == (0.1, 0.2, 0.3)
+assert isinstance(requests[1].error, utils.CommandError)
+assert isinstance(requests[2].error, nonblocking.Cancelled)
+print
+EOF
+
+echo "Test exporter module ..."
+python <<EOF || exit 1
+import exporter
+import urllib2
+import zlib
+e = exporter.Exporter(('127.0.0.1', 0), interval=3600).start()
+url = 'http://127.0.0.1:%d/metrics' % e.server.server_address[1]
+body = urllib2.urlopen(url).read()
+print "GET /metrics"
+print body
+gzipped = urllib2.urlopen(urllib2.Request(url, headers={'Accept-Encoding': 'gzip'})).read()
+e.stop()
+assert 'wusu_up{metric="memory"} 1.0' in body
+assert zlib.decompress(gzipped, 16 + zlib.MAX_WBITS) == body
+# FreeBSD interfaces have a row for every address.
+import replay
+import snapshot
+snap = snapshot.Snapshot('FreeBSD', replay.replay(replay.synthetic('load', 'FreeBSD', 2)),
+    replay.replay(replay.synthetic('storage', 'FreeBSD', 2))).take(['ifstat'])
+body = exporter.render(snap)
+assert 'wusu_ifstat_in_bytes{interface="em0",address="10.0.0.1"}' in body
+assert [l for l in body.split('\n') if l.startswith('wusu_ifstat_') and not l.startswith('wusu_ifstat_in_') and not l.startswith('wusu_ifstat_out_')] == []
+EOF
+
+echo "Test agent module ..."
+python <<EOF || exit 1
+import agent
+import load
+import records
+import os
+a = agent.Agent('/tmp/wusu-tests-%d.sock' % os.getpid()).start()
+c = agent.Client('load', a.path)
+print "Client('load').parse_memory(), parse_loadavg(typed=True)"
+print c.parse_memory(), c.parse_loadavg(typed=True)
+assert sorted(c.parse_memory()) == sorted(getattr(load, os.uname()[0])().parse_memory())
+ifstat = c.parse_ifstat(typed=True)
+assert c.parse_ifstat(include=['lo*']) == c.parse_ifstat(include=('lo*',))
+assert [i for i in ifstat.values() if not isinstance(i['in'], records.Record)] == []
+try:
+    c.parse_nothing()
+    raise AssertionError('parse_nothing() did not fail')
+except agent.AgentError:
+    pass
+c.close()
+a.stop()
+print
 EOF
 
 if [ $? = 0 ]; then
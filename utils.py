@@ -1,51 +1,435 @@
 import subprocess as sub
-import os, re
+import os, re, select, signal, time, fnmatch
+from itertools import islice
+import records
 
 _sysname = os.uname()[0]
 
-def run(cmd):
-    cmd = cmd.split()
-    p = sub.Popen(cmd, stdout=sub.PIPE, stderr=sub.STDOUT, universal_newlines=True)
-    p.wait()
-    if p.returncode == 0:
-        return p.communicate()[0]
-    return p.communicate()[1]
+# Default number of seconds a command may run before it is killed.
+TIMEOUT = 30
 
-def parser_storage(data, fields):
-    '''Parse storage data.'''
+class CommandError(Exception):
+    '''
+    Command exited with non-zero status, or was killed after running
+    for too long, in which case status is None.
+    '''
+    def __init__(self, cmd, status):
+        Exception.__init__(self, cmd, status)
+        self.cmd = cmd
+        self.status = status
+
+    def __str__(self):
+        if self.status is None:
+            return '%s: timed out' % self.cmd
+        return '%s: exit status %d' % (self.cmd, self.status)
+
+_clock = []
+
+def monotonic():
+    '''
+    Seconds from clock_gettime(CLOCK_MONOTONIC), which, unlike time.time(),
+    never jumps when the wall clock is set. Falls back to time.time().
+    '''
+    if not _clock:
+        try:
+            from ctypes import Structure, CDLL, byref, c_long
+            from ctypes.util import find_library
+            class Timespec(Structure):
+                _fields_ = [('sec', c_long), ('nsec', c_long)]
+            # CLOCK_MONOTONIC is 1 on Linux, 4 on FreeBSD and SunOS.
+            clock = {'Linux': 1}.get(_sysname, 4)
+            clock_gettime = CDLL(find_library('c'), use_errno=True).clock_gettime
+            ts = Timespec()
+            if clock_gettime(clock, byref(ts)) != 0:
+                raise OSError('clock_gettime')
+            def now():
+                # A Timespec per call, threads reading the clock at once do not share one.
+                ts = Timespec()
+                clock_gettime(clock, byref(ts))
+                return ts.sec + ts.nsec * 1e-9
+            _clock.append(now)
+        except Exception:
+            _clock.append(time.time)
+    return _clock[0]()
+
+def popen(cmd):
+    '''Start cmd with LC_ALL=C, stdout and stderr go to the same pipe.'''
+    env = dict(os.environ)
+    env['LC_ALL'] = 'C'
+    return sub.Popen(cmd.split(), stdout=sub.PIPE, stderr=sub.STDOUT, env=env, close_fds=True)
+
+def stream(cmd, timeout=None):
+    '''
+    Run cmd and yield lines of its output (stdout and stderr) as they arrive.
+    Commands run with LC_ALL=C, so their output does not depend on locale.
+    CommandError is raised after the last line if cmd failed, or as soon as
+    it runs longer than timeout seconds (TIMEOUT by default).
+    The command is killed if the generator is not consumed to the end.
+    '''
+    if timeout is None:
+        timeout = TIMEOUT
+    p = popen(cmd)
+    deadline = time.time() + timeout
+    fd = p.stdout.fileno()
+    rest = ''
+    try:
+        while True:
+            left = deadline - time.time()
+            if left <= 0:
+                raise CommandError(cmd, None)
+            if not select.select([fd], [], [], left)[0]:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            lines = (rest + chunk).split('\n')
+            rest = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if rest:
+            yield rest
+        # Output is closed, the command should be exiting.
+        while p.poll() is None:
+            if time.time() > deadline:
+                raise CommandError(cmd, None)
+            time.sleep(0.01)
+        if p.returncode != 0:
+            raise CommandError(cmd, p.returncode)
+    finally:
+        if p.returncode is None:
+            os.kill(p.pid, signal.SIGKILL)
+            p.wait()
+        p.stdout.close()
+
+def execute(cmd, timeout=None):
+    '''
+    Run cmd, see stream().
+    Returned structure is a tuple:
+    (exit status, output)
+    Exit status is None if cmd was killed after timeout seconds.
+    '''
+    output = []
+    try:
+        for line in stream(cmd, timeout):
+            output.append(line)
+    except CommandError, e:
+        return (e.status, ''.join(output))
+    return (0, ''.join(output))
+
+def run(cmd, timeout=None, lines=False):
+    '''
+    Run cmd and return its output, or None if it failed or timed out.
+    With lines=True an iterator over output lines is returned instead,
+    see stream(). All parsers accept both.
+    '''
+    if lines:
+        return stream(cmd, timeout)
+    status, output = execute(cmd, timeout)
+    if status == 0:
+        return output
+    return None
+
+def _lines(data, skip=0):
+    '''
+    Non-empty lines of data, which is a string or an iterator over lines,
+    without the first skip lines.
+    '''
+    if isinstance(data, basestring):
+        data = data.split('\n')
+    for line in islice(data, skip, None):
+        line = line.rstrip('\n')
+        if line.strip():
+            yield line
+
+def text(data):
+    '''data, a string or an iterator over lines, as one string.'''
+    if isinstance(data, basestring):
+        return data
+    return ''.join(data)
+
+def flatten(parsed, prefix=''):
+    '''
+    Flatten a parse_* result, nested dictionaries, records and tuples, into
+    a dictionary of numbers keyed by dotted paths:
+    flatten(load.Linux().parse_ifstat(), 'ifstat')
+    {'ifstat.eth0.in.bytes': value, ...}
+    Values that are not numbers (mount points) are left out, trailing
+    '%' signs are ignored.
+    '''
+    flat = {}
+    if hasattr(parsed, 'items'):
+        for key, value in parsed.items():
+            flat.update(flatten(value, prefix and '%s.%s' % (prefix, key) or str(key)))
+    elif isinstance(parsed, (tuple, list)):
+        for i, value in enumerate(parsed):
+            flat.update(flatten(value, prefix and '%s.%d' % (prefix, i) or str(i)))
+    elif parsed is not None:
+        try:
+            flat[prefix] = float(str(parsed).rstrip('%'))
+        except ValueError:
+            pass
+    return flat
+
+def _regex(patterns):
+    '''One regular expression matching any of patterns, see matcher().'''
+    regexes = []
+    for pattern in patterns:
+        if pattern.startswith('re:'):
+            regexes.append(pattern[3:])
+        else:
+            regexes.append(fnmatch.translate(pattern).replace('(?ms)', '') + '$')
+    return re.compile('|'.join(['(?:%s)' % r for r in regexes]), re.S).match
+
+def matcher(include=(), exclude=()):
+    '''
+    Return a function telling whether a row is selected by its names
+    (device, mount point, interface), None if nothing is filtered out.
+    Patterns are globs ('sd*', 'veth*'), or regular expressions matched
+    at the start of names when prefixed with 're:' ('re:(sd|nvme)').
+    A row is selected when any of its names matches include, if given,
+    and none of them matches exclude:
+    match = matcher(('sd*',), ('sda',))
+    match('sdb') and not match('sda')
+    '''
+    if not include and not exclude:
+        return None
+    included = include and _regex(include)
+    excluded = exclude and _regex(exclude)
+    def match(*names):
+        if included:
+            for name in names:
+                if included(name):
+                    break
+            else:
+                return False
+        if excluded:
+            for name in names:
+                if excluded(name):
+                    return False
+        return True
+    return match
+
+def literals(include):
+    '''
+    include as a list of plain names, to be passed to commands taking
+    device or interface names. None if include is empty or has patterns.
+    '''
+    if not include:
+        return None
+    for name in include:
+        if name.startswith('re:') or re.search(r'[*?[]', name):
+            return None
+    return list(include)
+
+def parser_storage(data, fields, typed=False, match=None):
+    '''
+    Parse storage data.
+    With typed=True, rows are records.Record instances with numeric values.
+    Rows are left out unless match, see matcher(), accepts their device or
+    last column, the mount point in df output.
+    '''
     if data == None:
         return None
     parsed = {}
-    # Transform data to array and remove header and an empty line at the end.
-    data = data.split('\n')[1:-1]
-    for item in data:
+    row = records.maker(fields, typed, 'Storage')
+    # Remove header.
+    for item in _lines(data, 1):
         if re.match('/', item):
             item = item.split()
-            parsed[item[0]] = {}
-            for i in range(1, len(fields)+1):
-                parsed[item[0]][fields[i-1]] = item[i]
+            if match and not match(item[0], item[-1]):
+                continue
+            parsed[item[0]] = row(item[1:len(fields)+1])
+    return parsed
+
+def parser_mountinfo(data, fstypes=(), exclude_fstypes=(), match=None):
+    '''
+    Parse Linux /proc/self/mountinfo data.
+    Mounts are left out unless match, see matcher(), accepts their device or mount point.
+    Returned structure is a list of tuples:
+    [(device, mount, fstype), ...]
+    '''
+    parsed = []
+    for item in _lines(data):
+        item = item.split()
+        # Optional fields end with a single '-', followed by fstype and device.
+        sep = item.index('-', 6)
+        fstype = item[sep+1]
+        if fstypes and fstype not in fstypes:
+            continue
+        if fstype in exclude_fstypes:
+            continue
+        # Spaces, tabs, newlines and backslashes are escaped as octal.
+        mount = re.sub(r'\\([0-7]{3})', lambda m: chr(int(m.group(1), 8)), item[4])
+        if match and not match(item[sep+2], mount):
+            continue
+        parsed.append((item[sep+2], mount, fstype))
+    return parsed
+
+def _percent(used, total):
+    '''Percent rounded up, as df(1) does.'''
+    if not total:
+        return '-'
+    return '%d%%' % -(-used * 100 // total)
+
+def parser_statvfs_fsusage(data, typed=False, match=None):
+    '''
+    Turn statvfs(2) results into df -k -P like usage info.
+    Filesystems without blocks (proc, sysfs, ...) are skipped, and so are
+    the ones not accepted by match, see matcher(), by device or mount point.
+    '''
+    parsed = {}
+    row = records.maker(('size', 'used', 'free', 'percent', 'mount'), typed, 'FSUsage')
+    for device, mount, fstype, st in data:
+        # f_frsize, f_blocks, f_bfree, f_bavail
+        frsize, blocks, bfree, bavail = st[1], st[2], st[3], st[4]
+        if not blocks or match and not match(device, mount):
+            continue
+        used = (blocks - bfree) * frsize / 1024
+        free = bavail * frsize / 1024
+        parsed[device] = row((str(blocks * frsize / 1024), str(used), str(free),
+            _percent(used, used + free), mount))
     return parsed
 
-def parser_iostat(data, fields):
-    '''Parse iostat data.'''
+def parser_statvfs_inodes(data, typed=False, match=None):
+    '''
+    Turn statvfs(2) results into df -i -P like inodes info.
+    Filesystems without blocks (proc, sysfs, ...) are skipped, see
+    parser_statvfs_fsusage().
+    '''
     parsed = {}
-    # Transform data to array and remove header (3 lines in Linux, 2 in FreeBSD) and an empty line at the end.
-    if _sysname == 'Linux':
-        data = data.split('\n')[3:-2]
-    if _sysname == 'FreeBSD' or _sysname == 'SunOS':
-        data = data.split('\n')[2:-1]
-    for item in data:
+    row = records.maker(('inodes', 'used', 'free', 'percent', 'mount'), typed, 'Inodes')
+    for device, mount, fstype, st in data:
+        # f_blocks, f_files, f_ffree
+        blocks, files, ffree = st[2], st[5], st[6]
+        if not blocks or match and not match(device, mount):
+            continue
+        parsed[device] = row((str(files), str(files - ffree), str(ffree),
+            _percent(files - ffree, files), mount))
+    return parsed
+
+def parser_iostat_linux(data, fields, typed=False, match=None):
+    '''
+    Parse Linux iostat -x data, three header lines and the device first.
+    With typed=True, rows are records.Record instances with numeric values.
+    Devices not accepted by match, see matcher(), are left out.
+    None is returned for no data, a failed command.
+    '''
+    if data == None:
+        return None
+    parsed = {}
+    row = records.maker(fields, typed, 'IOStat')
+    end = len(fields) + 1
+    for item in _lines(data, 3):
         item = item.split()
-        if _sysname == 'SunOS':
-            parsed[item[-1]] = {}
-            for i in range(0, len(fields)):
-                parsed[item[-1]][fields[i]] = item[i]
-        else:
-            parsed[item[0]] = {}
-            for i in range(1, len(fields)+1):
-                parsed[item[0]][fields[i-1]] = item[i]
+        if match and not match(item[0]):
+            continue
+        parsed[item[0]] = row(item[1:end])
+    return parsed
+
+def parser_iostat_freebsd(data, fields, typed=False, match=None):
+    '''
+    Parse FreeBSD iostat -x data, two header lines and the device first.
+    With typed=True, rows are records.Record instances with numeric values.
+    Devices not accepted by match, see matcher(), are left out.
+    None is returned for no data, a failed command.
+    '''
+    if data == None:
+        return None
+    parsed = {}
+    row = records.maker(fields, typed, 'IOStat')
+    end = len(fields) + 1
+    for item in _lines(data, 2):
+        item = item.split()
+        if match and not match(item[0]):
+            continue
+        parsed[item[0]] = row(item[1:end])
+    return parsed
+
+def parser_iostat_sunos(data, fields, typed=False, match=None):
+    '''
+    Parse SunOS iostat -xn data, two header lines and the device last.
+    With typed=True, rows are records.Record instances with numeric values.
+    Devices not accepted by match, see matcher(), are left out.
+    None is returned for no data, a failed command.
+    '''
+    if data == None:
+        return None
+    parsed = {}
+    row = records.maker(fields, typed, 'IOStat')
+    end = len(fields)
+    for item in _lines(data, 2):
+        item = item.split()
+        if match and not match(item[-1]):
+            continue
+        parsed[item[-1]] = row(item[:end])
     return parsed
 
+# iostat output differs between systems.
+_iostat_parsers = {'Linux': parser_iostat_linux, 'FreeBSD': parser_iostat_freebsd, 'SunOS': parser_iostat_sunos}
+
+def parser_iostat(data, fields, typed=False, sysname=None, match=None):
+    '''
+    Parse iostat data of sysname, the running system by default, with
+    one of the parser_iostat_* functions.
+    '''
+    return _iostat_parsers[sysname or _sysname](data, fields, typed, match)
+
+def parser_diskstats(data, previous, interval, typed=False, match=None):
+    '''
+    Parse Linux /proc/diskstats data.
+    Rates are computed against counters from the previous call over interval
+    seconds; devices missing from previous are compared against zero, which
+    gives averages since boot, the same as the first iostat report.
+    Devices not accepted by match, see matcher(), are left out of parsed
+    but not of counters, so the next call with another match still
+    compares them against this sample.
+    With typed=True, rows are records.Record instances and values are
+    not formatted as strings.
+
+    Returned structure is a tuple:
+    (parsed, counters)
+    counters must be passed as previous to the next call.
+    '''
+    parsed = {}
+    counters = {}
+    zero = (0,) * 11
+    fields = ('tps', 'kbrs', 'kbws', 'kbr', 'kbw', 'avgrq-sz', 'avgqu-sz', 'await', 'svctm', 'util')
+    if typed:
+        row = records.record(fields, 'IOStat')
+    else:
+        row = lambda *values: dict(zip(fields, [isinstance(v, float) and '%.2f' % v or str(v) for v in values]))
+    for item in _lines(data):
+        item = item.split()
+        if len(item) < 14:
+            continue
+        stats = tuple([int(i) for i in item[3:14]])
+        # Skip devices that never did any I/O (unused loop, ram devices), as iostat does.
+        if not stats[0] and not stats[4]:
+            continue
+        counters[item[2]] = stats
+        if match and not match(item[2]):
+            continue
+        old = previous.get(item[2], zero)
+        # Device was re-created or counters were reset, fall back to since-boot values.
+        if stats[0] < old[0] or stats[4] < old[4]:
+            old = zero
+        ios = (stats[0] - old[0]) + (stats[4] - old[4])
+        sectors = (stats[2] - old[2]) + (stats[6] - old[6])
+        ticks = (stats[3] - old[3]) + (stats[7] - old[7])
+        busy = stats[9] - old[9]
+        parsed[item[2]] = row(
+            ios / interval,
+            (stats[2] - old[2]) / 2.0 / interval,
+            (stats[6] - old[6]) / 2.0 / interval,
+            stats[2] / 2,
+            stats[6] / 2,
+            ios and float(sectors) / ios or 0.0,
+            (stats[10] - old[10]) / 1000.0 / interval,
+            ios and float(ticks) / ios or 0.0,
+            ios and float(busy) / ios or 0.0,
+            min(busy / 10.0 / interval, 100.0))
+    return parsed, counters
+
 def parser_uptime(data):
     '''Parse uptime data.'''
     seconds = int(data)
@@ -57,100 +441,265 @@ def parser_uptime(data):
     seconds = seconds % 60
     return (days, hours, minutes, seconds, int(data))
 
-def parser_memory(data, fields):
-    '''Parse memory data.'''
+def parser_memory(data, fields=None, pagesize=1, paged=()):
+    '''
+    Parse memory data in a single pass.
+    Only keys listed in fields are returned, all of them if fields is None.
+    Keys are matched exactly.
+
+    Values are integers in bytes: values with a kB suffix are multiplied
+    by 1024, values of keys ending with one of paged by pagesize.
+    Values that are not numbers are returned as they are.
+    '''
+    if fields is not None:
+        fields = set(fields)
     parsed = {}
-    data = data.split('\n')
-    for item in data:
-        for field in fields:
-            if re.match(field, item):
-                parsed[item.split()[0][:-1]] = item.split()[1]
+    for item in _lines(data):
+        item = item.split()
+        if len(item) < 2:
+            continue
+        key = item[0].rstrip(':')
+        if fields is not None and key not in fields:
+            continue
+        try:
+            value = int(item[1])
+        except ValueError:
+            parsed[key] = item[1]
+            continue
+        if len(item) > 2 and item[2] == 'kB':
+            value *= 1024
+        elif key.endswith(paged):
+            value *= pagesize
+        parsed[key] = value
     return parsed
 
-def parser_swap(data, fields):
-    '''Parse swap data.'''
+def parser_memory_usage(data):
+    '''
+    Derive free(1) values from parser_memory() output of /proc/meminfo.
+    cache includes reclaimable slab, used is total - available, as
+    procps-ng 4 computes it. Kernels older than 3.14 have no MemAvailable,
+    then available is estimated as free + buffers + cache and used is
+    total - free - buffers - cache, as older procps did.
+    '''
+    total = data['MemTotal']
+    free = data['MemFree']
+    buffers = data.get('Buffers', 0)
+    cache = data.get('Cached', 0) + data.get('SReclaimable', 0)
+    if 'MemAvailable' in data:
+        available = data['MemAvailable']
+        used = total - available
+    else:
+        available = free + buffers + cache
+        used = total - free - buffers - cache
+    return {
+        'total': total,
+        'used': max(used, 0),
+        'free': free,
+        'shared': data.get('Shmem', 0),
+        'buffers': buffers,
+        'cache': cache,
+        'available': min(available, total),
+        'swaptotal': data.get('SwapTotal', 0),
+        'swapused': data.get('SwapTotal', 0) - data.get('SwapFree', 0),
+        'swapfree': data.get('SwapFree', 0)
+    }
+
+def parser_swap(data, fields, typed=False, match=None):
+    '''
+    Parse swap data.
+    With typed=True, rows are records.Record instances with numeric values.
+    Devices not accepted by match, see matcher(), are left out.
+    None is returned for no data, a failed swap command.
+    '''
+    if data == None:
+        return None
     parsed = {}
-    if _sysname == 'Linux':
-        data = data.split('\n')[1:-1]
-    if _sysname == 'FreeBSD':
-        data = data.split('\n')[1:-2]
-    for item in data:
+    row = records.maker(fields, typed, 'Swap')
+    for item in _lines(data, 1):
         item = item.split()
-        parsed[item[0]] = {}
-        for i in range(1, len(fields)+1):
-            parsed[item[0]][fields[i-1]] = item[i]
+        # FreeBSD pstat -s adds a Total line when there is more than one device.
+        if item[0] == 'Total' or match and not match(item[0]):
+            continue
+        parsed[item[0]] = row(item[1:len(fields)+1])
     return parsed
 
-def parser_loadavg(data):
+def parser_loadavg(data, typed=False):
     parsed = []
-    data = data.split()
-    for num in data:
+    for num in ' '.join(_lines(data)).split():
         # I don't like this not one bit!
         if re.search('\.', num):
+            if typed:
+                num = float(num)
             parsed.append(num)
     return tuple(parsed)
 
-def parser_ifstat(data):
+def parser_ifstat_linux(data, typed=False, match=None):
+    '''
+    Parse Linux ip -s -o link data.
+    With typed=True, rows are records.Record instances with numeric values.
+    Interfaces not accepted by match, see matcher(), are left out.
+    None is returned for no data, a failed command.
+    '''
+    if data == None:
+        return None
+    parsed = {}
+    counters = records.maker(('bytes', 'packets', 'errors', 'dropped'), typed, 'Counters', int)
+    interface = records.maker(('in', 'out'), typed, 'Interface', None)
+    for item in _lines(data):
+        item = item.split()
+        if match and not match(item[1].strip(':')):
+            continue
+        parsed[item[1].strip(':')] = interface((
+            counters((item[-21], item[-20], item[-19], item[-18])),
+            counters((item[-6], item[-5], item[-4], item[-3]))))
+    return parsed
+
+def parser_ifstat_freebsd(data, typed=False, match=None):
+    '''
+    Parse FreeBSD netstat -i -d -b -n -W data.
+    With typed=True, rows are records.Record instances with numeric values.
+    Interfaces not accepted by match, see matcher(), are left out.
+    None is returned for no data, a failed command.
+    '''
+    if data == None:
+        return None
+    parsed = {}
+    counters = records.maker(('bytes', 'packets', 'errors', 'dropped'), typed, 'Counters', int)
+    interface = records.maker(('in', 'out'), typed, 'Interface', None)
+    for item in _lines(data, 1):
+        if match and not match(item.split(None, 1)[0]):
+            continue
+        # Replace '-' (no value) with '0'.
+        item = [value != '-' and value or '0' for value in item.split()]
+        if item[0] not in parsed:
+            parsed[item[0]] = {}
+        # With PPP, tunnel, pflog interfaces, netstat doesn't always display address info.
+        # Next field is always a counter - replace the value with NaN if we get a number.
+        if item[3].isdigit():
+            item[3] = 'NaN'
+        parsed[item[0]][item[3]] = interface((
+            counters((item[-6], item[-9], item[-8], item[-7])),
+            counters((item[-3], item[-5], item[-4], item[-1]))))
+    return parsed
+
+def parser_ifstat_sunos(data, typed=False, match=None):
+    '''
+    Parse SunOS dladm show-link -s data.
+    With typed=True, rows are records.Record instances with numeric values.
+    Interfaces not accepted by match, see matcher(), are left out.
+    None is returned for no data, a failed command.
+    '''
+    if data == None:
+        return None
     parsed = {}
-    if _sysname == 'Linux':
-        data = data.split('\n')[:-1]
-    if _sysname == 'FreeBSD' or _sysname == 'SunOS':
-        data = data.split('\n')[1:-1]
-    for item in data:
+    counters = records.maker(('bytes', 'packets', 'errors'), typed, 'Counters', int)
+    interface = records.maker(('in', 'out'), typed, 'Interface', None)
+    for item in _lines(data, 1):
+        if match and not match(item.split(None, 1)[0]):
+            continue
+        # Replace 'N/A' with '0'.
+        item = [value != 'N/A' and value or '0' for value in item.split()]
+        parsed[item[0]] = interface((
+            counters((item[2], item[1], item[3])),
+            counters((item[5], item[4], item[6]))))
+    return parsed
+
+# Interface statistics come from a different command on every system.
+_ifstat_parsers = {'Linux': parser_ifstat_linux, 'FreeBSD': parser_ifstat_freebsd, 'SunOS': parser_ifstat_sunos}
+
+def parser_ifstat(data, typed=False, sysname=None, match=None):
+    '''
+    Parse interface statistics of sysname, the running system by default,
+    with one of the parser_ifstat_* functions.
+    '''
+    return _ifstat_parsers[sysname or _sysname](data, typed, match)
+
+def parser_netdev(data, typed=False, match=None):
+    '''
+    Parse Linux /proc/net/dev data.
+    Receive counters come first, transmit counters start at column 8.
+    With typed=True, rows are records.Record instances with numeric values.
+    Interfaces not accepted by match, see matcher(), are left out.
+    '''
+    parsed = {}
+    counters = records.maker(('bytes', 'packets', 'errors', 'dropped'), typed, 'Counters', int)
+    interface = records.maker(('in', 'out'), typed, 'Interface', None)
+    # Remove two header lines.
+    for item in _lines(data, 2):
+        # Interface name and first counter are not always separated by a space.
+        name, item = item.split(':', 1)
+        name = name.strip()
+        if match and not match(name):
+            continue
         item = item.split()
-        # Replace '-' (FreeBSD) and 'N/A' (SunOS) with '0'.
-        for i in range(0, len(item)):
-            if item[i] == '-' or item[i] == 'N/A':
-                item[i] = '0'
-        if _sysname == 'Linux':
-            parsed[item[1].strip(':')] = {
-                'in': {
-                    'bytes': item[-21],
-                    'packets': item[-20],
-                    'errors': item[-19],
-                    'dropped': item[-18]
-                },
-                'out': {
-                    'bytes:': item[-6],
-                    'packets': item[-5],
-                    'errors': item[-4],
-                    'dropped': item[-3]
-                }
-            }
-        if _sysname == 'FreeBSD':
-            if item[0] not in parsed:
-                parsed[item[0]] = {}
-            # With PPP, tunnel, pflog interfaces, netstat doesn't always display address info.
-            # Next field is always a counter - replace the value with NaN if we get a number.
-            if item[3].isdigit():
-                item[3] = 'NaN'
-            parsed[item[0]][item[3]] = {
-                'in': {
-                    'bytes': item[-6],
-                    'packets': item[-9],
-                    'errors': item[-8],
-                    'dropped': item[-7]
-                },
-                'out': {
-                    'bytes': item[-3],
-                    'packets': item[-5],
-                    'errors': item[-4],
-                    'dropped': item[-1]
-                }
-            }
-        if _sysname == 'SunOS':
-            parsed[item[0]] = {
-                'in': {
-                    'bytes': item[2],
-                    'packets': item[1],
-                    'errors': item[3],
-                },
-                'out': {
-                    'bytes': item[5],
-                    'packets': item[4],
-                    'errors': item[6]
-                }
-            }
+        parsed[name] = interface((counters(item[0:4]), counters(item[8:12])))
+    return parsed
+
+def parser_pidstat(data):
+    '''
+    Parse Linux /proc/<pid>/stat data.
+    The command name is in parentheses and may hold spaces and parentheses
+    itself, fields are split after its last closing parenthesis.
+    Returned structure is a tuple:
+    (name, [state, ppid, pgrp, ...])
+    '''
+    start = data.index('(')
+    end = data.rindex(')')
+    return data[start + 1:end], data[end + 2:].split()
+
+def parser_cpustat(data, columns=0):
+    '''
+    Parse the cpu lines of Linux /proc/stat data, the summary line and
+    one line per CPU. Rows have at least columns counters, columns missing
+    on older kernels (steal, guest) are reported as '0'.
+    Returned structure is a tuple:
+    (names, [counter, ...], columns)
+    with columns counters of every CPU one after another, in the order of names.
+    '''
+    rows = [line.split() for line in _lines(data) if line.startswith('cpu')]
+    columns = max([len(row) - 1 for row in rows] + [columns])
+    names = []
+    counters = []
+    for row in rows:
+        names.append(row[0])
+        counters.extend(row[1:])
+        counters.extend(['0'] * (columns + 1 - len(row)))
+    return names, counters, columns
+
+def _value(value, typed):
+    if not typed:
+        return value
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+def parser_flatkeyed(data, typed=False):
+    '''
+    Parse 'key value' lines, as in cgroup cpu.stat and memory.stat.
+    Returned structure is a dictionary:
+    {key: value, ...}
+    '''
+    parsed = {}
+    for line in _lines(data):
+        key, value = line.split(None, 1)
+        parsed[key] = _value(value.strip(), typed)
+    return parsed
+
+def parser_nestedkeyed(data, typed=False):
+    '''
+    Parse 'name key=value key=value ...' lines, as in cgroup io.stat
+    (keyed by device numbers) and pressure files (keyed by some and full).
+    Returned structure is a dictionary of dictionaries:
+    {name: {key: value, ...}}
+    '''
+    parsed = {}
+    for line in _lines(data):
+        item = line.split()
+        row = parsed[item[0]] = {}
+        for pair in item[1:]:
+            key, value = pair.split('=', 1)
+            row[key] = _value(value, typed)
     return parsed
 
 if __name__ == '__main__':